@@ -6,6 +6,9 @@ from sqlalchemy.orm import Session
 from .dependencies import get_db
 from . import crud, schemas
 from .admin_auth import get_current_admin, create_access_token
+from .utils.cache_janitor import cache_janitor
+from .utils.price_parser import price_parser
+from .utils.station_diff import station_changelog
 
 router = APIRouter()
 
@@ -68,6 +71,22 @@ def get_settings(
     return crud.get_settings(db)
 
 
+@router.get("/cache/status")
+def get_cache_status(admin: str = Depends(get_current_admin)):
+    """Состояние кэша цен, фонового обновления и доступности API Татнефти"""
+    return {
+        **price_parser.refresher.get_status(),
+        "upstream": price_parser.breaker.get_status(),
+        "file_cache_janitor": cache_janitor.get_status(),
+    }
+
+
+@router.get("/cache/changes")
+def get_cache_changes(limit: int = 20, admin: str = Depends(get_current_admin)):
+    """Журнал изменений списка АЗС при последних обновлениях"""
+    return station_changelog.latest(limit)
+
+
 # В app/admin_api.py - при изменении настроек скидок
 @router.put("/settings/", response_model=schemas.Settings)
 def update_settings(
@@ -77,13 +96,11 @@ def update_settings(
 ):
     updated_settings = crud.update_settings(db, settings)
 
-    # Очищаем кэш всех АЗС при изменении скидок
+    # Пересчитываем табло цен под новую скидку вместо очистки кэша
     try:
-        from app.utils.price_parser import price_parser
-
-        price_parser.clear_all_cache()
-        print("Кэш всех АЗС очищен из-за изменения настроек скидок")
+        price_parser.get_price_board(updated_settings)
+        print("Табло цен пересчитано из-за изменения настроек скидок")
     except Exception as e:
-        print(f"Ошибка при очистке кэша настроек: {e}")
+        print(f"Ошибка при пересчете табло цен: {e}")
 
     return updated_settings
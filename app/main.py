@@ -1,14 +1,43 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 
 from .utils.notifications import handle_websocket
 
 from .admin_api import router as admin_router
-from .user_api import router as user_router
+from .user_api import router as user_router, warm_up_price_data
 from .emulator_api import router as emulator_router
+from .utils.cache_janitor import cache_janitor
+from .utils.price_parser import price_parser
+
+WARMUP_TIMEOUT = float(os.getenv("PRICE_WARMUP_TIMEOUT", "30"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Загружаем данные цен до приема запросов; при неудаче воркер стартует,
+    # но /health/ready не сообщает о готовности, пока данные не загрузятся
+    try:
+        await asyncio.wait_for(warm_up_price_data(), WARMUP_TIMEOUT)
+    except Exception as e:
+        print(f"Прогрев кэша цен не завершен: {e!r}")
+    # Фоновое обновление цен, чтобы запросы не ждали API Татнефти
+    price_parser.refresher.start()
+    # Удаление устаревших и вытеснение лишних записей файлового кэша
+    cache_janitor.start()
+    yield
+    await cache_janitor.stop()
+    await price_parser.refresher.stop()
+    # Закрываем пул соединений к API Татнефти
+    await price_parser.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +63,13 @@ async def root():
     return {"message": "Tatneft MiniApp API"}
 
 
+@app.get("/health/ready")
+async def readiness():
+    """Проверка готовности воркера для балансировщика нагрузки"""
+    status = price_parser.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
 @app.websocket("/admin/ws")
 async def websocket_endpoint(websocket: WebSocket):
     # Добавьте проверку origin
@@ -109,6 +109,86 @@ class AzsWithCoords(AzsBaseResponse):
     distance: Optional[float] = None
 
 
+class AzsBulkRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=500)
+
+
+class AzsBulkResponse(BaseModel):
+    items: List[AzsBaseResponse]
+    missing: List[int]  # ID, для которых АЗС не найдена
+
+
+class GeoPoint(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+
+class NearbyBatchRequest(BaseModel):
+    points: List[GeoPoint] = Field(..., min_length=1, max_length=1000)
+    radius_km: float = Field(default=50, gt=0)
+
+
+class NearbyBatchItem(BaseModel):
+    lat: float
+    lon: float
+    azs: Optional[AzsWithCoords] = None  # None, если в радиусе нет АЗС
+
+
+class NearbyBatchResponse(BaseModel):
+    results: List[NearbyBatchItem]
+
+
+class CheapestNearbyRank(str, Enum):
+    PRICE = "price"
+    SCORE = "score"  # Цена с учетом расстояния
+
+
+class CheapestNearbyResponse(BaseModel):
+    items: List[AzsWithCoords]
+
+
+class RouteStationsRequest(BaseModel):
+    points: List[GeoPoint] = Field(..., min_length=2, max_length=5000)
+    corridor_km: float = Field(5, gt=0, le=50)
+
+
+class RouteStation(AzsWithCoords):
+    route_km: float  # Положение АЗС вдоль маршрута от его начала
+
+
+class RouteStationsResponse(BaseModel):
+    items: List[RouteStation]
+
+
+class MapMarker(BaseModel):
+    id: Optional[int] = None
+    number: Optional[int] = None
+    lat: float
+    lon: float
+
+
+class MapCluster(BaseModel):
+    lat: float
+    lon: float
+    count: int
+
+
+class MapTile(BaseModel):
+    clusters: List[MapCluster]
+    markers: List[MapMarker]
+
+
+class AzsSearchSort(str, Enum):
+    NUMBER = "number"
+    REGION = "region"
+    PRICE = "price"
+
+
+class AzsSearchResponse(BaseModel):
+    total: int  # Всего найдено АЗС (без учета limit/offset)
+    items: List[AzsBaseResponse]
+
+
 class PaymentRequest(BaseModel):
     return_url: str
 
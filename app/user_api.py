@@ -1,8 +1,8 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from math import radians, sin, cos, sqrt, atan2
 
 from app.utils.notifications import notify_new_order
 from app.utils.validations import validate_azs_number
@@ -10,12 +10,17 @@ from app.utils.alfa_payment import AlfaPayment
 from app.utils.auth import create_access_token, verify_password
 from .utils.alfa_payment_emulator import alfa_emulator
 
+from .database import SessionLocal
 from .dependencies import get_db
 from . import crud, schemas
-from .utils.price_parser import PriceParser
+from .utils.map_tiles import MAX_ZOOM
+from .utils.price_parser import price_parser
+from .utils.response_cache import cached_json_response, render_model
+from .utils.station_records import Station
+
+NEARBY_RADIUS_KM = 50
 
 router = APIRouter()
-price_parser = PriceParser()
 alfa_payment = AlfaPayment()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -75,13 +80,6 @@ async def create_order(
 
         print(f"Order created successfully: ID={order.id}")
 
-        # Очищаем кэш для конкретной АЗС - исправляем получение azs_id
-        azs_id = order_data.azs_id  # Получаем из данных заказа
-        price_parser.clear_azs_cache(order_data.azs_number, azs_id)
-        print(
-            f"Кэш очищен для АЗС {order_data.azs_number} (ID: {azs_id or 'не указан'})"
-        )
-
         return order
 
     except HTTPException:
@@ -159,78 +157,373 @@ def get_settings(db: Session = Depends(get_db)):
     return crud.get_settings(db)
 
 
+async def warm_up_price_data():
+    """Прогрев кэша при запуске: данные, индексы, табло и ответы по АЗС"""
+    db = SessionLocal()
+    try:
+        settings = crud.get_settings(db)
+    finally:
+        db.close()
+
+    board = await price_parser.warm_up(settings)
+    if board is None:
+        return
+    for azs_id, azs_data in board.by_id.items():
+        board.get_response(
+            ("azs", azs_id),
+            lambda: render_model(schemas.AzsBaseResponse, azs_data),
+        )
+
+
+def _azs_with_distance_body(board, azs: Station, distance: float) -> bytes:
+    """JSON АЗС с координатами и расстоянием из готовых байтов табло цен"""
+    azs_id = azs.id
+    # Готовый ответ без расстояния кэшируется вместе с табло цен
+    cached = board.get_response(
+        ("coords", azs_id),
+        lambda: render_model(
+            schemas.AzsWithCoords,
+            {**board.by_id[azs_id], "lat": azs.lat, "lon": azs.lon},
+            exclude={"distance"},
+        ),
+    )
+    # Расстояние - последнее поле схемы, дописываем его в конец объекта
+    return cached.body[:-1] + b',"distance":' + orjson.dumps(round(distance, 2)) + b"}"
+
+
 @router.get("/azs/nearby", response_model=schemas.AzsWithCoords)
 async def get_nearest_azs(lat: float, lon: float, db: Session = Depends(get_db)):
     """Получение ближайшей АЗС по геолокации"""
     try:
         settings = crud.get_settings(db)
 
-        # Получаем список всех АЗС с координатами
-        azs_list = price_parser.get_azs_list(use_cache_on_error=True)
-        if not azs_list:
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
             raise HTTPException(
                 status_code=404, detail="Не удалось загрузить список АЗС"
             )
 
-        # Находим ближайшую АЗС
-        nearest_azs = None
-        min_distance = float("inf")
+        # Ищем ближайшую АЗС через пространственный индекс в радиусе 50 км
+        nearest = board.snapshot.spatial_index.nearest(
+            lat, lon, k=1, radius_km=NEARBY_RADIUS_KM
+        )
+        if not nearest:
+            raise HTTPException(
+                status_code=404, detail="В радиусе 50 км не найдено АЗС"
+            )
+        min_distance, nearest_azs = nearest[0]
+        body = _azs_with_distance_body(board, nearest_azs, min_distance)
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in get_nearest_azs: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 
-        for azs in azs_list:
-            if azs.get("lat") and azs.get("lon"):
-                distance = calculate_distance(lat, lon, azs["lat"], azs["lon"])
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_azs = azs
+@router.get("/azs/nearby/cheapest", response_model=schemas.CheapestNearbyResponse)
+async def get_cheapest_nearby_azs(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    fuel_type_id: Optional[int] = None,
+    filter_group: Optional[str] = None,
+    radius_km: float = Query(10, gt=0, le=NEARBY_RADIUS_KM),
+    k: int = Query(5, ge=1, le=50),
+    rank: schemas.CheapestNearbyRank = schemas.CheapestNearbyRank.PRICE,
+    distance_weight: float = Query(1.0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """Самые дешевые АЗС с нужным топливом в радиусе от геолокации
 
-        if not nearest_azs:
+    При rank=score АЗС ранжируются по цене плюс distance_weight руб. за
+    каждый километр пути до АЗС.
+    """
+    try:
+        if (fuel_type_id is None) == (not filter_group):
             raise HTTPException(
-                status_code=404, detail="В радиусе 50 км не найдено АЗС"
+                status_code=422,
+                detail="Укажите fuel_type_id ИЛИ filter_group",
             )
 
-        # Получаем данные с применением скидок
-        azs_data = price_parser.get_azs_data_with_discount(
-            nearest_azs["number"], settings, nearest_azs["id"]
+        settings = crud.get_settings(db)
+
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
+
+        found = board.cheapest_nearby(
+            lat,
+            lon,
+            board.fuel_type_ids(fuel_type_id, filter_group),
+            radius_km=radius_km,
+            k=k,
+            distance_weight=(
+                distance_weight if rank == schemas.CheapestNearbyRank.SCORE else None
+            ),
         )
 
-        if "error" in azs_data:
-            raise HTTPException(status_code=404, detail=azs_data["error"])
+        bodies = [
+            _azs_with_distance_body(board, azs, distance) for distance, azs, _ in found
+        ]
+        body = b'{"items":[' + b",".join(bodies) + b"]}"
+        return Response(content=body, media_type="application/json")
 
-        azs_data["distance"] = round(min_distance, 2)
-        azs_data["lat"] = nearest_azs["lat"]
-        azs_data["lon"] = nearest_azs["lon"]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in get_cheapest_nearby_azs: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/azs/nearby/batch", response_model=schemas.NearbyBatchResponse)
+async def get_nearest_azs_batch(
+    batch: schemas.NearbyBatchRequest, db: Session = Depends(get_db)
+):
+    """Получение ближайших АЗС сразу для набора точек (автопарк, маршрут)"""
+    try:
+        settings = crud.get_settings(db)
+
+        # Табло берется один раз: поиск и данные АЗС - из одного снимка
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
 
-        return azs_data
+        points = [(point.lat, point.lon) for point in batch.points]
+        nearest = board.snapshot.spatial_index.nearest_many(
+            points, radius_km=batch.radius_km
+        )
+
+        items = []
+        for (lat, lon), found in zip(points, nearest):
+            azs_body = b"null"
+            if found is not None:
+                distance, azs = found
+                azs_body = _azs_with_distance_body(board, azs, distance)
+            items.append(
+                b'{"lat":'
+                + orjson.dumps(lat)
+                + b',"lon":'
+                + orjson.dumps(lon)
+                + b',"azs":'
+                + azs_body
+                + b"}"
+            )
+        body = b'{"results":[' + b",".join(items) + b"]}"
+        return Response(content=body, media_type="application/json")
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in get_nearest_azs: {str(e)}")
+        print(f"Unexpected error in get_nearest_azs_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/azs/route", response_model=schemas.RouteStationsResponse)
+async def get_route_azs(
+    route: schemas.RouteStationsRequest, db: Session = Depends(get_db)
+):
+    """АЗС вдоль маршрута в коридоре corridor_km, по порядку следования"""
+    try:
+        settings = crud.get_settings(db)
+
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
+
+        found = board.snapshot.spatial_index.along_route(
+            [(point.lat, point.lon) for point in route.points], route.corridor_km
+        )
+
+        # route_km - последнее поле схемы, дописываем его после расстояния
+        bodies = [
+            _azs_with_distance_body(board, azs, distance)[:-1]
+            + b',"route_km":'
+            + orjson.dumps(round(route_km, 2))
+            + b"}"
+            for route_km, distance, azs in found
+        ]
+        body = b'{"items":[' + b",".join(bodies) + b"]}"
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in get_route_azs: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/azs/map/{z}/{x}/{y}", response_model=schemas.MapTile)
+async def get_map_tile(z: int, x: int, y: int, request: Request):
+    """Маркеры и кластеры АЗС для тайла карты z/x/y"""
+    try:
+        if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+            raise HTTPException(status_code=422, detail="Некорректный тайл карты")
+
+        await price_parser.get_azs_list_async(use_cache_on_error=True)
+        snapshot = price_parser.snapshot
+        if snapshot is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
+
+        map_tiles = await snapshot.map_tiles_async()
+        return cached_json_response(map_tiles.get(z, x, y), request)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in get_map_tile: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/azs/bulk", response_model=schemas.AzsBulkResponse)
+async def get_azs_bulk(bulk: schemas.AzsBulkRequest, db: Session = Depends(get_db)):
+    """Получение цен сразу для набора АЗС (избранное, региональное табло)"""
+    try:
+        settings = crud.get_settings(db)
+
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
+
+        # Собираем ответ из готовых байтов каждой АЗС из табло цен
+        bodies = []
+        missing = []
+        for azs_id in dict.fromkeys(bulk.ids):
+            azs_data = board.by_id.get(azs_id)
+            if azs_data is None:
+                missing.append(azs_id)
+                continue
+            cached = board.get_response(
+                ("azs", azs_id),
+                lambda: render_model(schemas.AzsBaseResponse, azs_data),
+            )
+            bodies.append(cached.body)
+
+        body = (
+            b'{"items":['
+            + b",".join(bodies)
+            + b'],"missing":'
+            + orjson.dumps(missing)
+            + b"}"
+        )
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in get_azs_bulk: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/azs/search", response_model=schemas.AzsSearchResponse)
+async def search_azs(
+    region: Optional[str] = None,
+    fuel_type_id: Optional[int] = None,
+    filter_group: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: schemas.AzsSearchSort = schemas.AzsSearchSort.NUMBER,
+    descending: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """Поиск АЗС по региону, виду топлива и диапазону цен со скидкой"""
+    try:
+        if fuel_type_id is not None and filter_group:
+            raise HTTPException(
+                status_code=422,
+                detail="Укажите только fuel_type_id ИЛИ filter_group",
+            )
+        has_fuel = fuel_type_id is not None or bool(filter_group)
+        if not has_fuel and (
+            min_price is not None
+            or max_price is not None
+            or sort == schemas.AzsSearchSort.PRICE
+        ):
+            raise HTTPException(
+                status_code=422,
+                detail="Для фильтра и сортировки по цене укажите вид топлива",
+            )
+
+        settings = crud.get_settings(db)
+
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
+
+        found = board.search(
+            region=region,
+            fuel_type_ids=board.fuel_type_ids(fuel_type_id, filter_group),
+            min_price=min_price,
+            max_price=max_price,
+            sort=sort.value,
+            descending=descending,
+        )
+
+        # Собираем страницу из готовых байтов каждой АЗС из табло цен
+        bodies = []
+        for azs_id, _ in found[offset : offset + limit]:
+            cached = board.get_response(
+                ("azs", azs_id),
+                lambda: render_model(schemas.AzsBaseResponse, board.by_id[azs_id]),
+            )
+            bodies.append(cached.body)
+
+        body = (
+            b'{"total":'
+            + orjson.dumps(len(found))
+            + b',"items":['
+            + b",".join(bodies)
+            + b"]}"
+        )
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in search_azs: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.get("/azs/{azs_number}/{azs_id}", response_model=schemas.AzsBaseResponse)
-async def get_specific_azs(azs_number: int, azs_id: int, db: Session = Depends(get_db)):
+async def get_specific_azs(
+    azs_number: int, azs_id: int, request: Request, db: Session = Depends(get_db)
+):
     """Получение данных конкретной АЗС по ID"""
     try:
         validate_azs_number(azs_number)
         settings = crud.get_settings(db)
 
-        # Получаем данные с применением скидок, передавая azs_id
-        azs_data = price_parser.get_azs_data_with_discount(azs_number, settings, azs_id)
-        if "error" in azs_data:
-            raise HTTPException(status_code=404, detail=azs_data["error"])
-
-        # Проверяем, что возвращена правильная АЗС
-        if azs_data.get("id") != azs_id:
-            print(
-                f"ВНИМАНИЕ: Запрошена АЗС ID {azs_id}, но возвращена АЗС ID {azs_data.get('id')}"
+        board = await price_parser.get_price_board_async(settings)
+        if board is None:
+            raise HTTPException(
+                status_code=404, detail="Не удалось загрузить список АЗС"
+            )
+        if board.snapshot.find(azs_number, azs_id) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"АЗС с номером {azs_number} и ID {azs_id} не найдена",
             )
 
-        # Убеждаемся, что ID установлен правильно
-        azs_data["id"] = azs_id
-
-        return azs_data
+        # Готовые байты ответа с ETag, без повторной проверки через схему
+        cached = board.get_response(
+            ("azs", azs_id),
+            lambda: render_model(schemas.AzsBaseResponse, board.by_id[azs_id]),
+        )
+        return cached_json_response(cached, request)
 
     except HTTPException:
         raise
@@ -243,8 +536,14 @@ async def get_specific_azs(azs_number: int, azs_id: int, db: Session = Depends(g
 async def refresh_cache(db: Session = Depends(get_db)):
     """Принудительное обновление кэша данных"""
     try:
-        price_parser.force_refresh_all_cache()
+        if not await price_parser.force_refresh_all_cache_async():
+            raise HTTPException(
+                status_code=503,
+                detail="Не удалось обновить кэш, используются последние данные",
+            )
         return {"status": "success", "message": "Кэш успешно обновлен"}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Ошибка при обновлении кэша: {e}")
         raise HTTPException(status_code=500, detail="Ошибка обновления кэша")
@@ -319,21 +618,3 @@ async def get_current_user(
             detail="Invalid authentication credentials",
         )
     return user
-
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Вычисление расстояния между двумя точками в километрах (формула Haversine)"""
-    R = 6371  # Радиус Земли в километрах
-
-    lat1_rad = radians(lat1)
-    lon1_rad = radians(lon1)
-    lat2_rad = radians(lat2)
-    lon2_rad = radians(lon2)
-
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = sin(dlat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-    return R * c
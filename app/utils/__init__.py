@@ -1,4 +1,4 @@
-from .price_parser import PriceParser
+from .price_parser import PriceParser, price_parser
 from .validations import validate_azs_number
 from .notifications import notify_new_order, notify_order_update
 from .alfa_payment import AlfaPayment
@@ -7,6 +7,7 @@ from .file_cache import FileCache, file_cache
 
 __all__ = [
     "PriceParser",
+    "price_parser",
     "validate_azs_number",
     "notify_new_order",
     "notify_order_update",
@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+class CacheBackend(ABC):
+    """Хранилище второго уровня FileCache: байты по ключу и время их записи
+
+    Запись должна быть атомарной: читатель из любого процесса видит либо
+    старое, либо новое значение целиком, но не наполовину записанное.
+    """
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Пара (данные, время записи как timestamp) или None"""
+
+    @abstractmethod
+    def read_updated_at(self, key: str) -> Optional[float]:
+        """Время записи без чтения самих данных"""
+
+    @abstractmethod
+    def write(self, key: str, payload: bytes, updated_at: float):
+        """Атомарно заменяет значение ключа"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Удаляет ключ; True, если он был"""
+
+    @abstractmethod
+    def keys(self, prefix: str = "") -> List[str]:
+        """Ключи, начинающиеся с prefix"""
+
+    @abstractmethod
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """Все записи как (ключ, размер в байтах, время записи) для очистки"""
+
+    def remove_temp_files(self, older_than: float) -> int:
+        """Удаляет остатки прерванных записей старше older_than (timestamp)"""
+        return 0
+
+
+class FilesBackend(CacheBackend):
+    """Каждый ключ - отдельный файл {key}.cache в каталоге кэша
+
+    Записи хранятся в двоичном формате кодека, поэтому расширение
+    нейтральное. Файлы {key}.json прежних версий по-прежнему читаются,
+    пока их не заменит новая запись или не удалит очистка.
+
+    Файл сначала пишется во временный, сбрасывается на диск (fsync) и
+    затем атомарно подменяет старый через os.replace, после чего на диск
+    сбрасывается и сам каталог - так после сбоя питания остается либо
+    старое, либо новое значение целиком. Время изменения файла равно
+    времени записи.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(exist_ok=True)
+
+    SUFFIX = ".cache"
+    LEGACY_SUFFIX = ".json"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.SUFFIX}"
+
+    def _legacy_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.LEGACY_SUFFIX}"
+
+    def read(self, key: str) -> Optional[Tuple[bytes, float]]:
+        for path in (self._path(key), self._legacy_path(key)):
+            try:
+                with open(path, "rb") as f:
+                    return f.read(), os.fstat(f.fileno()).st_mtime
+            except FileNotFoundError:
+                continue
+        return None
+
+    def read_updated_at(self, key: str) -> Optional[float]:
+        for path in (self._path(key), self._legacy_path(key)):
+            try:
+                return path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+        return None
+
+    def write(self, key: str, payload: bytes, updated_at: float):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.utime(temp_path, (updated_at, updated_at))
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        # Прежний файл больше не нужен: иначе он всплывет после удаления ключа
+        self._unlink(self._legacy_path(key))
+        self._fsync_dir()
+
+    def _fsync_dir(self):
+        """Сбрасывает на диск запись каталога о переименовании файла"""
+        try:
+            fd = os.open(self.cache_dir, os.O_RDONLY)
+        except OSError:
+            # Каталог нельзя открыть (например, в Windows) - пропускаем
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _unlink(path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete(self, key: str) -> bool:
+        removed = self._unlink(self._path(key))
+        return self._unlink(self._legacy_path(key)) or removed
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return [key for key, _, _ in self.entries() if key.startswith(prefix)]
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        # Если у ключа есть и новый, и прежний файл, читается новый
+        result = {}
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith(self.SUFFIX):
+                    key = item.name[: -len(self.SUFFIX)]
+                elif item.name.endswith(self.LEGACY_SUFFIX):
+                    key = item.name[: -len(self.LEGACY_SUFFIX)]
+                    if key in result:
+                        continue
+                else:
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                if item.is_file():
+                    result[key] = (key, stat.st_size, stat.st_mtime)
+        return list(result.values())
+
+    def remove_temp_files(self, older_than: float) -> int:
+        removed = 0
+        for path in self.cache_dir.glob("*.tmp"):
+            try:
+                if path.stat().st_mtime < older_than:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class SQLiteBackend(CacheBackend):
+    """Общий для всех воркеров кэш в одном файле SQLite в режиме WAL
+
+    WAL позволяет читать параллельно с записью из других процессов, а
+    каждая запись - отдельная транзакция, поэтому после сбоя в базе
+    остается либо старое, либо новое значение. Соединения - свои у
+    каждого потока.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, payload BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def read(self, key: str) -> Optional[Tuple[bytes, float]]:
+        row = (
+            self._connection()
+            .execute("SELECT payload, updated_at FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return (bytes(row[0]), row[1]) if row else None
+
+    def read_updated_at(self, key: str) -> Optional[float]:
+        row = (
+            self._connection()
+            .execute("SELECT updated_at FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def write(self, key: str, payload: bytes, updated_at: float):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, payload, updated_at) VALUES (?, ?, ?)",
+            (key, payload, updated_at),
+        )
+
+    def delete(self, key: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def keys(self, prefix: str = "") -> List[str]:
+        # Экранируем спецсимволы LIKE в префиксе
+        pattern = (
+            prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        )
+        rows = self._connection().execute(
+            "SELECT key FROM cache WHERE key LIKE ? ESCAPE '\\'", (pattern,)
+        )
+        return [row[0] for row in rows]
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        return (
+            self._connection()
+            .execute("SELECT key, length(payload), updated_at FROM cache")
+            .fetchall()
+        )
+
+
+def create_backend(cache_dir: Path) -> CacheBackend:
+    """Хранилище по переменной окружения FILE_CACHE_BACKEND (files или sqlite)"""
+    backend = os.getenv("FILE_CACHE_BACKEND", "files")
+    if backend == "sqlite":
+        path = os.getenv("FILE_CACHE_SQLITE_PATH", str(cache_dir / "cache.sqlite3"))
+        return SQLiteBackend(Path(path))
+    if backend == "files":
+        return FilesBackend(cache_dir)
+    raise ValueError(f"Неизвестное хранилище кэша FILE_CACHE_BACKEND={backend}")
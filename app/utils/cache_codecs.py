@@ -0,0 +1,128 @@
+"""Сериализация и сжатие записей FileCache
+
+Каждая запись начинается с заголовка: сигнатура, версия формата,
+сериализатор и способ сжатия. Поэтому запись читается независимо от
+текущих настроек, а записи старого формата (чистый JSON без заголовка)
+продолжают читаться. Сравнение кодеков - app/utils/codec_benchmark.py.
+"""
+
+import gzip
+import json
+import os
+from typing import Any, Callable, Dict, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"FC"
+FORMAT_VERSION = 1
+HEADER_SIZE = 5
+
+# Идентификаторы в заголовке записи не должны меняться
+SERIALIZER_IDS = {"json": 1, "orjson": 2, "msgpack": 3}
+COMPRESSION_IDS = {"none": 0, "gzip": 1, "zstd": 2}
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _serializers() -> Dict[str, Tuple[Callable, Callable]]:
+    available = {"json": (_json_dumps, json.loads)}
+    if orjson is not None:
+        available["orjson"] = (
+            lambda value: orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS),
+            orjson.loads,
+        )
+    if msgpack is not None:
+        available["msgpack"] = (
+            lambda value: msgpack.packb(value, use_bin_type=True),
+            lambda payload: msgpack.unpackb(payload, raw=False, strict_map_key=False),
+        )
+    return available
+
+
+def _compressors() -> Dict[str, Tuple[Callable, Callable]]:
+    available = {
+        "none": (lambda data: data, lambda data: data),
+        "gzip": (lambda data: gzip.compress(data, compresslevel=5), gzip.decompress),
+    }
+    if zstandard is not None:
+        available["zstd"] = (
+            zstandard.ZstdCompressor(level=3).compress,
+            zstandard.ZstdDecompressor().decompress,
+        )
+    return available
+
+
+SERIALIZERS = _serializers()
+COMPRESSORS = _compressors()
+
+
+class Codec:
+    """Кодек записей кэша: сериализатор и способ сжатия"""
+
+    def __init__(self, serializer: str = "json", compression: str = "none"):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Сериализатор {serializer} недоступен")
+        if compression not in COMPRESSORS:
+            raise ValueError(f"Сжатие {compression} недоступно")
+        self.serializer = serializer
+        self.compression = compression
+        self._dumps = SERIALIZERS[serializer][0]
+        self._compress = COMPRESSORS[compression][0]
+        self._header = MAGIC + bytes(
+            [
+                FORMAT_VERSION,
+                SERIALIZER_IDS[serializer],
+                COMPRESSION_IDS[compression],
+            ]
+        )
+
+    @classmethod
+    def from_env(cls) -> "Codec":
+        """Кодек по FILE_CACHE_SERIALIZER и FILE_CACHE_COMPRESSION"""
+        default = "orjson" if "orjson" in SERIALIZERS else "json"
+        return cls(
+            os.getenv("FILE_CACHE_SERIALIZER", default),
+            os.getenv("FILE_CACHE_COMPRESSION", "none"),
+        )
+
+    def encode(self, value: Any) -> bytes:
+        return self._header + self._compress(self._dumps(value))
+
+
+_SERIALIZER_NAMES = {code: name for name, code in SERIALIZER_IDS.items()}
+_COMPRESSION_NAMES = {code: name for name, code in COMPRESSION_IDS.items()}
+
+
+def decode(payload: bytes) -> Any:
+    """Разбирает запись любого поддерживаемого формата, в том числе старого"""
+    if not payload.startswith(MAGIC):
+        # Запись до появления заголовков - JSON как есть
+        return json.loads(payload)
+
+    version, serializer_id, compression_id = payload[2:HEADER_SIZE]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Неизвестная версия формата записи кэша: {version}")
+    serializer = _SERIALIZER_NAMES.get(serializer_id)
+    compression = _COMPRESSION_NAMES.get(compression_id)
+    if serializer not in SERIALIZERS or compression not in COMPRESSORS:
+        raise ValueError(
+            f"Кодек записи кэша недоступен: {serializer}/{compression} "
+            f"({serializer_id}/{compression_id})"
+        )
+    data = COMPRESSORS[compression][1](payload[HEADER_SIZE:])
+    return SERIALIZERS[serializer][1](data)
@@ -0,0 +1,82 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional
+
+from app.utils.file_cache import file_cache
+
+
+class CacheJanitor:
+    """Периодическая очистка файлового кэша
+
+    Удаляет устаревшие записи и вытесняет лишние сверх лимитов FileCache
+    (см. FileCache.cleanup), чтобы каталог кэша и время его просмотра не
+    росли бесконечно. Очистка выполняется в пуле потоков кэша и не
+    блокирует цикл событий.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.interval = int(os.getenv("FILE_CACHE_JANITOR_INTERVAL", "300"))
+        self.last_run: Optional[datetime] = None
+        self.last_result: Optional[dict] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запускает периодическую очистку (из работающего цикла событий)"""
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> Optional[dict]:
+        """Одна очистка; результат также сохраняется для статуса"""
+        self.last_run = datetime.now()
+        try:
+            self.last_result = await self.cache.cleanup_async()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Ошибка очистки файлового кэша: {e}")
+            return None
+
+        self.last_error = None
+        if self.last_result["expired"] or self.last_result["evicted"]:
+            print(
+                f"Очистка файлового кэша: удалено устаревших "
+                f"{self.last_result['expired']}, вытеснено {self.last_result['evicted']}"
+            )
+        return self.last_result
+
+    async def _run(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def get_status(self) -> dict:
+        """Состояние очистки и лимиты кэша для админ-панели"""
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "eviction": self.cache.eviction,
+            "max_entries": self.cache.max_entries,
+            "max_bytes": self.cache.max_bytes,
+            "retention_hours": self.cache.retention.total_seconds() / 3600,
+            "last_run": self.last_run,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+# Очистка общего файлового кэша, запускается вместе с приложением
+cache_janitor = CacheJanitor(file_cache)
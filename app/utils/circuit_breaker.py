@@ -0,0 +1,122 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """Вызов не выполнялся: upstream считается недоступным"""
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для запросов к внешнему API
+
+    Следит за долей ошибок и медленных ответов среди последних вызовов.
+    Если их слишком много, выключатель размыкается: вызовы сразу получают
+    CircuitOpenError, не дожидаясь таймаута. По истечении паузы (растущей
+    с каждым неудачным пробным вызовом, со случайным разбросом) пропускается
+    один пробный вызов; его успех замыкает выключатель.
+
+    Таймаут вызова подстраивается под реальное время ответа upstream:
+    несколько типичных времен ответа, но не больше max_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, max_timeout: float):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.min_timeout = float(os.getenv("UPSTREAM_MIN_TIMEOUT", "2"))
+        # Вызов дольше этого времени считается медленным (как ошибка)
+        self.slow_call = float(os.getenv("UPSTREAM_SLOW_CALL", "5"))
+        self.failure_rate = float(os.getenv("UPSTREAM_FAILURE_RATE", "0.5"))
+        self.min_calls = int(os.getenv("UPSTREAM_MIN_CALLS", "4"))
+        self.open_base = float(os.getenv("UPSTREAM_OPEN_SECONDS", "5"))
+        self.open_max = float(os.getenv("UPSTREAM_OPEN_MAX_SECONDS", "300"))
+
+        self._lock = threading.Lock()
+        # Последние вызовы: (успех, длительность в секундах)
+        self._calls = deque(maxlen=int(os.getenv("UPSTREAM_WINDOW", "20")))
+        self.state = self.CLOSED
+        self._opened_count = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов сейчас (в полуоткрытом состоянии - один)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() < self._open_until:
+                    return False
+                self.state = self.HALF_OPEN
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def timeout(self) -> float:
+        """Срок на один вызов по последним успешным временам ответа"""
+        with self._lock:
+            latencies = sorted(latency for ok, latency in self._calls if ok)
+        if len(latencies) < self.min_calls:
+            return self.max_timeout
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return max(self.min_timeout, min(self.max_timeout, p95 * 3))
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._calls.append((latency < self.slow_call, latency))
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                self.state = self.CLOSED
+                self._opened_count = 0
+                self._calls.clear()
+            else:
+                self._check_window()
+
+    def record_failure(self, latency: float, error: Exception):
+        with self._lock:
+            self._calls.append((False, latency))
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                self._open()
+            else:
+                self._check_window()
+
+    def _check_window(self):
+        if self.state != self.CLOSED or len(self._calls) < self.min_calls:
+            return
+        failures = sum(1 for ok, _ in self._calls if not ok)
+        if failures / len(self._calls) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        # Пауза растет вдвое после каждого неудачного пробного вызова
+        pause = min(self.open_max, self.open_base * 2**self._opened_count)
+        pause *= random.uniform(0.8, 1.2)
+        self._opened_count += 1
+        self._open_until = time.monotonic() + pause
+        self.state = self.OPEN
+        print(f"Upstream {self.name} недоступен, повтор через {pause:.1f} с")
+
+    def get_status(self) -> dict:
+        with self._lock:
+            calls = list(self._calls)
+            retry_in = max(0.0, self._open_until - time.monotonic())
+            state = self.state
+        return {
+            "state": state,
+            "retry_in_seconds": round(retry_in, 1) if state == self.OPEN else None,
+            "recent_calls": len(calls),
+            "recent_failures": sum(1 for ok, _ in calls if not ok),
+            "timeout_seconds": round(self.timeout(), 2),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,81 @@
+"""Сравнение кодеков записей FileCache на реальном списке АЗС из кэша
+
+python -m app.utils.codec_benchmark [--key azs_list] [--file path.json]
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable
+
+from app.utils.cache_codecs import COMPRESSORS, SERIALIZERS, Codec, decode
+from app.utils.file_cache import file_cache
+
+
+def _best_time(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmark(value: Any, repeat: int = 5) -> list:
+    """Размер, время кодирования и разбора для всех доступных кодеков"""
+    legacy = json.dumps(value, ensure_ascii=False, indent=2).encode()
+    results = [
+        {
+            "codec": "json indent=2 (прежний формат)",
+            "bytes": len(legacy),
+            "encode_ms": _best_time(
+                lambda: json.dumps(value, ensure_ascii=False, indent=2), repeat
+            )
+            * 1000,
+            "decode_ms": _best_time(lambda: json.loads(legacy), repeat) * 1000,
+        }
+    ]
+    for serializer in SERIALIZERS:
+        for compression in COMPRESSORS:
+            codec = Codec(serializer, compression)
+            payload = codec.encode(value)
+            results.append(
+                {
+                    "codec": f"{serializer}+{compression}",
+                    "bytes": len(payload),
+                    "encode_ms": _best_time(lambda: codec.encode(value), repeat) * 1000,
+                    "decode_ms": _best_time(lambda: decode(payload), repeat) * 1000,
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение кодеков записей кэша")
+    parser.add_argument("--key", default="azs_list", help="ключ записи в FileCache")
+    parser.add_argument("--file", help="JSON-файл с данными вместо записи кэша")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            value = decode(f.read())
+    else:
+        entry = file_cache.get_entry(args.key)
+        if entry is None:
+            parser.error(f"В кэше нет записи {args.key}")
+        value = {"data": entry.value, "updated_at": entry.updated_at.isoformat()}
+
+    results = benchmark(value, args.repeat)
+    baseline = results[0]
+    print(f"{'кодек':<32}{'байт':>12}{'размер':>9}{'запись, мс':>13}{'чтение, мс':>13}")
+    for row in results:
+        print(
+            f"{row['codec']:<32}{row['bytes']:>12}"
+            f"{row['bytes'] / baseline['bytes']:>8.0%} "
+            f"{row['encode_ms']:>12.2f}{row['decode_ms']:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,223 @@
-import json
+import asyncio
+import functools
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
 
+from app.utils.cache_backends import create_backend
+from app.utils.cache_codecs import Codec, decode
+
 logger = logging.getLogger(__name__)
 
 
+class CacheEntry:
+    """Данные из кэша вместе с временем их обновления (одно чтение)"""
+
+    __slots__ = ("value", "updated_at")
+
+    def __init__(self, value: Any, updated_at: datetime):
+        self.value = value
+        self.updated_at = updated_at
+
+    def is_fresh(self, timeout: timedelta) -> bool:
+        return datetime.now() - self.updated_at <= timeout
+
+
 class FileCache:
+    """Кэш в хранилище, общем для всех воркеров (см. cache_backends)
+
+    Отдельного уровня в памяти нет: данные, нужные на каждом запросе,
+    процесс держит сам - снимок АЗС, справочник топлива и табло цен
+    (см. PriceParser), а кэш читается только при их загрузке.
+
+    Методы *_async для асинхронного кода выполняют обращения к хранилищу в
+    отдельном пуле потоков (FILE_CACHE_IO_THREADS), не блокируя цикл
+    событий.
+
+    Размер хранилища ограничен: cleanup (его периодически вызывает
+    CacheJanitor) удаляет записи старше FILE_CACHE_RETENTION_HOURS, а при
+    превышении FILE_CACHE_MAX_ENTRIES или FILE_CACHE_MAX_BYTES вытесняет
+    записи по FILE_CACHE_EVICTION: lru - давно не читанные, lfu - реже
+    читанные. Статистика чтений своя у каждого процесса; записи, которые
+    процесс не читал, считаются прочитанными в момент записи.
+    """
+
     def __init__(self, cache_dir: str = "cache"):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         self.cache_timeout = timedelta(minutes=15)
+        self.backend = create_backend(self.cache_dir)
+        self.codec = Codec.from_env()
+        self.max_entries = int(os.getenv("FILE_CACHE_MAX_ENTRIES", "10000"))
+        self.max_bytes = int(os.getenv("FILE_CACHE_MAX_BYTES", "268435456"))
+        self.retention = timedelta(
+            hours=float(os.getenv("FILE_CACHE_RETENTION_HOURS", "24"))
+        )
+        self.eviction = os.getenv("FILE_CACHE_EVICTION", "lru")
+        if self.eviction not in ("lru", "lfu"):
+            raise ValueError(
+                f"Неизвестная политика вытеснения FILE_CACHE_EVICTION={self.eviction}"
+            )
+        # Чтения записей этим процессом: key -> (время последнего, количество)
+        self._reads: Dict[str, Tuple[float, int]] = {}
+        self._reads_lock = threading.Lock()
+        # Потоки создаются при первом обращении к хранилищу из async-кода
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("FILE_CACHE_IO_THREADS", "4")),
+            thread_name_prefix="file-cache-io",
+        )
+
+    def _run_io(self, func: Callable, *args, **kwargs) -> "asyncio.Future":
+        """Выполняет синхронное обращение к хранилищу в пуле потоков кэша"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(
+            self._io_executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Данные и время обновления за одно чтение, без проверки срока"""
+        try:
+            stored = self.backend.read(key)
+            if stored is None:
+                return None
+            document = decode(stored[0])
+            data = document["data"]
+            updated_at = datetime.fromisoformat(document["updated_at"])
+        except Exception as e:
+            logger.error(f"Error reading cache entry {key}: {e}")
+            return None
+
+        with self._reads_lock:
+            count = self._reads.get(key, (0.0, 0))[1]
+            self._reads[key] = (time.time(), count + 1)
+        return CacheEntry(data, updated_at)
 
-    def _get_file_path(self, key: str) -> Path:
-        return self.cache_dir / f"{key}.json"
+    async def get_entry_async(self, key: str) -> Optional[CacheEntry]:
+        """Асинхронный вариант get_entry"""
+        return await self._run_io(self.get_entry, key)
 
     def get(self, key: str) -> Optional[Any]:
-        file_path = self._get_file_path(key)
-        if not file_path.exists():
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh(self.cache_timeout):
             return None
+        return entry.value
 
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if (
-                datetime.now() - datetime.fromisoformat(data["updated_at"])
-                > self.cache_timeout
-            ):
-                return None
-            return data["data"]
-        except Exception as e:
-            logger.error(f"Error reading cache file {file_path}: {e}")
+    async def get_async(self, key: str) -> Optional[Any]:
+        """Асинхронный вариант get"""
+        entry = await self.get_entry_async(key)
+        if entry is None or not entry.is_fresh(self.cache_timeout):
             return None
+        return entry.value
 
     def set(self, key: str, data: Any):
-        file_path = self._get_file_path(key)
         try:
-            cache_data = {"data": data, "updated_at": datetime.now().isoformat()}
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            updated_at = datetime.now()
+            cache_data = {"data": data, "updated_at": updated_at.isoformat()}
+            payload = self.codec.encode(cache_data)
+            # Время записи в хранилище совпадает с updated_at: по нему
+            # get_last_updated проверяет свежесть без разбора данных
+            self.backend.write(key, payload, updated_at.timestamp())
         except Exception as e:
-            logger.error(f"Error writing cache file {file_path}: {e}")
+            logger.error(f"Error writing cache entry {key}: {e}")
+
+    async def set_async(self, key: str, data: Any):
+        """Асинхронный вариант set: сериализация и запись - в пуле потоков"""
+        await self._run_io(self.set, key, data)
 
     def delete(self, key: str):
         """Удаляет данные по ключу"""
-        file_path = self._get_file_path(key)
+        with self._reads_lock:
+            self._reads.pop(key, None)
         try:
-            if file_path.exists():
-                file_path.unlink()
-                return True
-            return False
+            return self.backend.delete(key)
         except Exception as e:
-            logger.error(f"Error deleting cache file {file_path}: {e}")
+            logger.error(f"Error deleting cache entry {key}: {e}")
             return False
 
+    async def delete_async(self, key: str):
+        """Асинхронный вариант delete"""
+        return await self._run_io(self.delete, key)
+
+    def cleanup(self) -> dict:
+        """Удаляет устаревшие записи и вытесняет лишние сверх лимитов"""
+        expire_before = time.time() - self.retention.total_seconds()
+        expired = evicted = 0
+        candidates = []
+        total_bytes = 0
+        for key, size, updated_at in self.backend.entries():
+            if updated_at < expire_before:
+                self.delete(key)
+                expired += 1
+                continue
+            total_bytes += size
+            candidates.append((key, size, updated_at))
+
+        total_entries = len(candidates)
+        if total_entries > self.max_entries or total_bytes > self.max_bytes:
+            with self._reads_lock:
+                reads = dict(self._reads)
+
+            def rank(candidate):
+                key, _, updated_at = candidate
+                last_read, count = reads.get(key, (updated_at, 0))
+                last_used = max(last_read, updated_at)
+                return (count, last_used) if self.eviction == "lfu" else last_used
+
+            for key, size, _ in sorted(candidates, key=rank):
+                if total_entries <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                self.delete(key)
+                evicted += 1
+                total_entries -= 1
+                total_bytes -= size
+
+        # Статистика чтений не должна расти из-за ключей, удаленных другими
+        with self._reads_lock:
+            live = {key for key, _, _ in candidates}
+            self._reads = {k: v for k, v in self._reads.items() if k in live}
+
+        # Временный файл старше минуты - остаток прерванной записи
+        temp_files = self.backend.remove_temp_files(time.time() - 60)
+        return {
+            "expired": expired,
+            "evicted": evicted,
+            "temp_files": temp_files,
+            "entries": total_entries,
+            "size_bytes": total_bytes,
+        }
+
+    async def cleanup_async(self) -> dict:
+        """Асинхронный вариант cleanup"""
+        return await self._run_io(self.cleanup)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """Ключи хранилища, начинающиеся с prefix"""
+        try:
+            return self.backend.keys(prefix)
+        except Exception as e:
+            logger.error(f"Error listing cache keys: {e}")
+            return []
 
     def get_last_updated(self, key: str) -> Optional[datetime]:
-        """Получает время последнего обновления кэша"""
-        file_path = self._get_file_path(key)
-        if not file_path.exists():
-            return None
+        """Получает время последнего обновления кэша (без чтения данных)"""
+        return self._stored_updated_at(key)
+
+    async def get_last_updated_async(self, key: str) -> Optional[datetime]:
+        """Асинхронный вариант get_last_updated"""
+        return await self._run_io(self._stored_updated_at, key)
 
+    def _stored_updated_at(self, key: str) -> Optional[datetime]:
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return datetime.fromisoformat(data["updated_at"])
+            timestamp = self.backend.read_updated_at(key)
         except Exception as e:
-            logger.error(f"Error reading cache file {file_path}: {e}")
+            logger.error(f"Error reading cache entry {key}: {e}")
             return None
+        return datetime.fromtimestamp(timestamp) if timestamp is not None else None
 
 
     def is_cache_expired(self, key: str, hours: int = 12) -> bool:
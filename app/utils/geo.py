@@ -0,0 +1,337 @@
+from collections import defaultdict
+from math import radians, sin, cos, sqrt, atan2, floor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.station_records import Station
+
+EARTH_RADIUS_KM = 6371  # Радиус Земли в километрах
+KM_PER_DEGREE = 111.195  # Длина одного градуса широты в километрах
+BATCH_MATRIX_CELLS = 2_000_000  # Максимум ячеек матрицы расстояний за один проход
+ROUTE_SEGMENT_KM = 20  # Длинные отрезки маршрута дробятся для узких рамок поиска
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Вычисление расстояния между двумя точками в километрах (формула Haversine)"""
+    lat1_rad = radians(lat1)
+    lon1_rad = radians(lon1)
+    lat2_rad = radians(lat2)
+    lon2_rad = radians(lon2)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = sin(dlat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_matrix(
+    lats_rad: np.ndarray,
+    lons_rad: np.ndarray,
+    station_lats_rad: np.ndarray,
+    station_lons_rad: np.ndarray,
+) -> np.ndarray:
+    """Матрица расстояний (точки x АЗС) в километрах, координаты в радианах"""
+    dlat = station_lats_rad[np.newaxis, :] - lats_rad[:, np.newaxis]
+    dlon = station_lons_rad[np.newaxis, :] - lons_rad[:, np.newaxis]
+
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lats_rad)[:, np.newaxis]
+        * np.cos(station_lats_rad)[np.newaxis, :]
+        * np.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class SpatialIndex:
+    """Сеточный пространственный индекс АЗС (ячейки cell_size x cell_size градусов)
+
+    Строится один раз на каждую версию списка АЗС и после построения не
+    изменяется, поэтому его можно безопасно читать из любых запросов.
+    Следующую версию с заменой нескольких АЗС строит updated.
+    """
+
+    def __init__(self, stations: Iterable[Station], cell_size: float = 0.1):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[Station]] = defaultdict(list)
+        self.points: List[Station] = []
+
+        for azs in stations:
+            lat, lon = azs.lat, azs.lon
+            if lat and lon:
+                self.cells[self._cell(lat, lon)].append(azs)
+                self.points.append(azs)
+
+        self.cells = dict(self.cells)
+        # Координаты в радианах для векторизованных пакетных запросов
+        self._lats_rad = np.radians([azs.lat for azs in self.points])
+        self._lons_rad = np.radians([azs.lon for azs in self.points])
+        self._update_bounds()
+
+    def updated(
+        self, removed: Iterable[Station], added: Iterable[Station]
+    ) -> "SpatialIndex":
+        """Новый индекс без АЗС removed и с АЗС added; этот индекс не меняется
+
+        Копируются только ячейки, в которых что-то изменилось, поэтому
+        замена нескольких АЗС не перестраивает весь индекс. АЗС из removed
+        ищутся по ссылке - это должны быть записи из этого индекса.
+        """
+        removed = {azs for azs in removed if azs.lat and azs.lon}
+        added = [azs for azs in added if azs.lat and azs.lon]
+
+        index = SpatialIndex((), self.cell_size)
+        cells = dict(self.cells)
+        for azs in removed:
+            cell = self._cell(azs.lat, azs.lon)
+            remaining = [other for other in cells[cell] if other is not azs]
+            if remaining:
+                cells[cell] = remaining
+            else:
+                del cells[cell]
+        for azs in added:
+            cell = self._cell(azs.lat, azs.lon)
+            cells[cell] = cells.get(cell, []) + [azs]
+        index.cells = cells
+
+        keep = [
+            position for position, azs in enumerate(self.points) if azs not in removed
+        ]
+        index.points = [self.points[position] for position in keep] + added
+        index._lats_rad = np.concatenate(
+            (self._lats_rad[keep], np.radians([azs.lat for azs in added]))
+        )
+        index._lons_rad = np.concatenate(
+            (self._lons_rad[keep], np.radians([azs.lon for azs in added]))
+        )
+        index._update_bounds()
+        return index
+
+    def _update_bounds(self):
+        self.size = len(self.points)
+        if self.cells:
+            rows = [cell[0] for cell in self.cells]
+            cols = [cell[1] for cell in self.cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            self._bounds = None
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return floor(lat / self.cell_size), floor(lon / self.cell_size)
+
+    def _ring(self, row: int, col: int, ring: int):
+        """Ячейки на границе квадрата радиусом ring вокруг (row, col)"""
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
+
+    def _max_ring(self, row: int, col: int) -> int:
+        """Номер кольца, после которого в индексе гарантированно нет точек"""
+        min_row, max_row, min_col, max_col = self._bounds
+        return max(
+            abs(row - min_row),
+            abs(row - max_row),
+            abs(col - min_col),
+            abs(col - max_col),
+        )
+
+    def _ring_min_distance(self, lat: float, ring: int) -> float:
+        """Нижняя оценка расстояния до любой точки в кольце ring и дальше"""
+        if ring <= 1:
+            return 0.0
+        # Самая узкая по долготе ячейка находится на краю просмотренной полосы
+        edge_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_size)
+        step_km = self.cell_size * KM_PER_DEGREE * cos(radians(edge_lat))
+        return (ring - 1) * step_km
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        radius_km: Optional[float] = None,
+    ) -> List[Tuple[float, Station]]:
+        """Возвращает до k ближайших АЗС в виде (расстояние_км, азс), по возрастанию
+
+        Если указан radius_km, станции дальше этого радиуса не возвращаются.
+        """
+        if not self.cells or k <= 0:
+            return []
+
+        row, col = self._cell(lat, lon)
+        max_ring = self._max_ring(row, col)
+        found: List[Tuple[float, Station]] = []
+
+        ring = 0
+        while ring <= max_ring:
+            bound = self._ring_min_distance(lat, ring)
+            if radius_km is not None and bound > radius_km:
+                break
+            if len(found) >= k and found[k - 1][0] <= bound:
+                break
+
+            for cell in self._ring(row, col, ring):
+                for azs in self.cells.get(cell, ()):
+                    distance = calculate_distance(lat, lon, azs.lat, azs.lon)
+                    if radius_km is None or distance <= radius_km:
+                        found.append((distance, azs))
+
+            found.sort(key=lambda item: item[0])
+            ring += 1
+
+        return found[:k]
+
+    def within(
+        self, lat: float, lon: float, radius_km: float
+    ) -> List[Tuple[float, Station]]:
+        """Все АЗС в радиусе radius_km в виде (расстояние_км, азс), без сортировки"""
+        if not self.cells:
+            return []
+
+        row, col = self._cell(lat, lon)
+        max_ring = self._max_ring(row, col)
+        found: List[Tuple[float, Station]] = []
+
+        ring = 0
+        while ring <= max_ring and self._ring_min_distance(lat, ring) <= radius_km:
+            for cell in self._ring(row, col, ring):
+                for azs in self.cells.get(cell, ()):
+                    distance = calculate_distance(lat, lon, azs.lat, azs.lon)
+                    if distance <= radius_km:
+                        found.append((distance, azs))
+            ring += 1
+
+        return found
+
+    def along_route(
+        self, route: Sequence[Tuple[float, float]], corridor_km: float
+    ) -> List[Tuple[float, float, Station]]:
+        """АЗС в коридоре corridor_km вокруг маршрута (ломаной из точек lat, lon)
+
+        Возвращает (км_от_начала_маршрута, расстояние_до_маршрута_км, азс),
+        упорядоченные по положению вдоль маршрута. Для каждого отрезка
+        просматриваются только ячейки его расширенной на коридор рамки;
+        расстояние до отрезка считается в локальной плоской проекции.
+        """
+        if not self.cells or len(route) < 2:
+            return []
+
+        found: Dict[int, Tuple[float, float, Station]] = {}
+        start_km = 0.0
+        for (lat1, lon1), (lat2, lon2) in zip(route, route[1:]):
+            length = calculate_distance(lat1, lon1, lat2, lon2)
+            parts = max(1, int(length // ROUTE_SEGMENT_KM) + 1)
+            for part in range(parts):
+                a_lat = lat1 + (lat2 - lat1) * part / parts
+                a_lon = lon1 + (lon2 - lon1) * part / parts
+                b_lat = lat1 + (lat2 - lat1) * (part + 1) / parts
+                b_lon = lon1 + (lon2 - lon1) * (part + 1) / parts
+                self._collect_near_segment(
+                    a_lat,
+                    a_lon,
+                    b_lat,
+                    b_lon,
+                    start_km + length * part / parts,
+                    length / parts,
+                    corridor_km,
+                    found,
+                )
+            start_km += length
+
+        return sorted(found.values(), key=lambda item: (item[0], item[1]))
+
+    def _collect_near_segment(
+        self,
+        lat1: float,
+        lon1: float,
+        lat2: float,
+        lon2: float,
+        start_km: float,
+        length_km: float,
+        corridor_km: float,
+        found: Dict[int, Tuple[float, float, Station]],
+    ):
+        """Добавляет в found АЗС не дальше corridor_km от отрезка"""
+        edge_lat = min(89.0, max(abs(lat1), abs(lat2)) + corridor_km / KM_PER_DEGREE)
+        km_per_lon = KM_PER_DEGREE * cos(radians(edge_lat))
+        lat_margin = corridor_km / KM_PER_DEGREE
+        lon_margin = corridor_km / km_per_lon
+        min_row, min_col = self._cell(
+            min(lat1, lat2) - lat_margin, min(lon1, lon2) - lon_margin
+        )
+        max_row, max_col = self._cell(
+            max(lat1, lat2) + lat_margin, max(lon1, lon2) + lon_margin
+        )
+        bounds = self._bounds
+        min_row, max_row = max(min_row, bounds[0]), min(max_row, bounds[1])
+        min_col, max_col = max(min_col, bounds[2]), min(max_col, bounds[3])
+
+        # Локальная плоская проекция в километрах с началом в первой точке
+        x_scale = KM_PER_DEGREE * cos(radians((lat1 + lat2) / 2))
+        dx = (lon2 - lon1) * x_scale
+        dy = (lat2 - lat1) * KM_PER_DEGREE
+        length_sq = dx * dx + dy * dy
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for azs in self.cells.get((row, col), ()):
+                    px = (azs.lon - lon1) * x_scale
+                    py = (azs.lat - lat1) * KM_PER_DEGREE
+                    t = 0.0
+                    if length_sq:
+                        t = min(1.0, max(0.0, (px * dx + py * dy) / length_sq))
+                    distance = sqrt((px - t * dx) ** 2 + (py - t * dy) ** 2)
+                    if distance > corridor_km:
+                        continue
+                    azs_id = azs.id
+                    current = found.get(azs_id)
+                    if current is None or distance < current[1]:
+                        found[azs_id] = (
+                            start_km + t * length_km,
+                            distance,
+                            azs,
+                        )
+
+    def nearest_many(
+        self,
+        points: Sequence[Tuple[float, float]],
+        radius_km: Optional[float] = None,
+    ) -> List[Optional[Tuple[float, Station]]]:
+        """Ближайшая АЗС для каждой точки (lat, lon) одним векторизованным расчетом
+
+        Для точек, у которых в радиусе radius_km нет АЗС, возвращается None.
+        """
+        if not points:
+            return []
+        if not self.size:
+            return [None] * len(points)
+
+        coords = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+        chunk = max(1, BATCH_MATRIX_CELLS // self.size)
+        results: List[Optional[Tuple[float, Station]]] = []
+
+        for start in range(0, len(coords), chunk):
+            part = coords[start : start + chunk]
+            distances = haversine_matrix(
+                part[:, 0], part[:, 1], self._lats_rad, self._lons_rad
+            )
+            nearest = distances.argmin(axis=1)
+            nearest_distances = distances[np.arange(len(part)), nearest]
+
+            for position, distance in zip(nearest.tolist(), nearest_distances.tolist()):
+                if radius_km is not None and distance > radius_km:
+                    results.append(None)
+                else:
+                    results.append((distance, self.points[position]))
+
+        return results
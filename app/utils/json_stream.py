@@ -0,0 +1,118 @@
+import codecs
+import json
+from typing import Any, List, Tuple
+
+_WHITESPACE = " \t\n\r"
+
+
+class JsonObjectStream:
+    """Потоковый разбор JSON-объекта верхнего уровня по частям тела ответа
+
+    Значения полей объекта возвращаются по мере получения как тройки
+    (поле, значение, элемент списка). Поле stream_key со списком
+    разбирается поэлементно: каждый элемент возвращается (с признаком
+    True), как только получен целиком, поэтому тело ответа никогда не
+    хранится в памяти полностью - только текущий недоразобранный хвост.
+    Любое другое значение stream_key (null, объект) возвращается целиком
+    с признаком False, как и остальные поля.
+    """
+
+    def __init__(self, stream_key: str):
+        self.stream_key = stream_key
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._state = "start"
+        self._key = None
+        self._closed = False
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, Any, bool]]:
+        """Принимает очередную часть тела; возвращает разобранные поля"""
+        self._buffer += self._text.decode(chunk)
+        return self._parse()
+
+    def close(self) -> List[Tuple[str, Any, bool]]:
+        """Завершает разбор; ValueError, если тело оборвано или некорректно"""
+        self._buffer += self._text.decode(b"", final=True)
+        self._closed = True
+        items = self._parse()
+        if self._state != "done":
+            raise ValueError("Некорректный или неполный JSON-объект")
+        return items
+
+    def _next_char(self, pos: int, skip: str = _WHITESPACE) -> int:
+        while pos < len(self._buffer) and self._buffer[pos] in skip:
+            pos += 1
+        return pos
+
+    def _decode(self, pos: int):
+        """Разбирает значение с позиции pos; None, если данных пока не хватает"""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, pos)
+        except json.JSONDecodeError:
+            if self._closed:
+                raise ValueError("Некорректный JSON в ответе API")
+            return None
+        # Число в конце части тела может быть еще не дописано
+        if end == len(self._buffer) and not self._closed:
+            return None
+        return value, end
+
+    def _parse(self) -> List[Tuple[str, Any, bool]]:
+        items = []
+        pos = 0
+        while self._state != "done":
+            if self._state in ("key", "items"):
+                pos = self._next_char(pos, _WHITESPACE + ",")
+            else:
+                pos = self._next_char(pos)
+            if pos >= len(self._buffer):
+                break
+            char = self._buffer[pos]
+
+            if self._state == "start":
+                if char != "{":
+                    raise ValueError("Ожидался JSON-объект")
+                pos += 1
+                self._state = "key"
+            elif self._state == "key":
+                if char == "}":
+                    pos += 1
+                    self._state = "done"
+                    continue
+                decoded = self._decode(pos)
+                if decoded is None:
+                    break
+                key, end = decoded
+                colon = self._next_char(end)
+                if colon >= len(self._buffer):
+                    break
+                if self._buffer[colon] != ":":
+                    raise ValueError("Ожидалось двоеточие после имени поля")
+                self._key = key
+                pos = colon + 1
+                self._state = "value"
+            elif self._state == "value":
+                if self._key == self.stream_key and char == "[":
+                    pos += 1
+                    self._state = "items"
+                    continue
+                decoded = self._decode(pos)
+                if decoded is None:
+                    break
+                value, pos = decoded
+                items.append((self._key, value, False))
+                self._state = "key"
+            elif self._state == "items":
+                if char == "]":
+                    pos += 1
+                    self._state = "key"
+                    continue
+                decoded = self._decode(pos)
+                if decoded is None:
+                    break
+                value, pos = decoded
+                items.append((self.stream_key, value, True))
+
+        self._buffer = self._buffer[pos:]
+        return items
@@ -0,0 +1,118 @@
+from math import floor, log, pi, radians, tan, cos
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from app.utils.response_cache import CachedResponse
+from app.utils.station_records import Station
+
+MAX_CLUSTER_ZOOM = 14  # Начиная со следующего масштаба маркеры не группируются
+MAX_ZOOM = 22
+CLUSTERS_PER_TILE_SIDE = 4  # Сетка кластеризации 4x4 ячейки (по 64 px) на тайл
+MAX_MERCATOR_LAT = 85.05112878
+
+EMPTY_TILE = CachedResponse(b'{"clusters":[],"markers":[]}')
+
+
+def mercator(lat: float, lon: float) -> Tuple[float, float]:
+    """Координаты точки в проекции Web Mercator, нормированные к [0, 1)"""
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0
+    return min(x, 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def _marker(azs: Station) -> dict:
+    return {
+        "id": azs.id,
+        "number": azs.number,
+        "lat": azs.lat,
+        "lon": azs.lon,
+    }
+
+
+class MapTiles:
+    """Кластеры маркеров АЗС для карты по тайлам z/x/y
+
+    Кластеры для масштабов 0..MAX_CLUSTER_ZOOM строятся один раз на снимок
+    списка АЗС; на более крупных масштабах тайл содержит отдельные маркеры.
+    Маркер несет только поля, нужные карте (ID, номер, координаты), а JSON
+    каждого непустого тайла сериализуется один раз при первом обращении.
+    """
+
+    def __init__(self, stations: Iterable[Station]):
+        points: List[Tuple[float, float, Station]] = []
+        for azs in stations:
+            if azs.lat and azs.lon:
+                x, y = mercator(azs.lat, azs.lon)
+                points.append((x, y, azs))
+
+        self.size = len(points)
+        self.tiles: Dict[Tuple[int, int, int], dict] = {}
+        for zoom in range(MAX_CLUSTER_ZOOM + 1):
+            self._build_clusters(zoom, points)
+
+        # Станции по тайлам первого масштаба без кластеров, для отбора
+        # маркеров на любом более крупном масштабе
+        leaf_zoom = MAX_CLUSTER_ZOOM + 1
+        scale = 1 << leaf_zoom
+        self._leaves: Dict[Tuple[int, int], List[Tuple[float, float, Station]]] = {}
+        for x, y, azs in points:
+            key = (floor(x * scale), floor(y * scale))
+            self._leaves.setdefault(key, []).append((x, y, azs))
+
+        self._responses: Dict[Tuple[int, int, int], CachedResponse] = {}
+
+    def _build_clusters(self, zoom: int, points: List[Tuple[float, float, Station]]):
+        scale = (1 << zoom) * CLUSTERS_PER_TILE_SIDE
+        cells: Dict[Tuple[int, int], List[Station]] = {}
+        for x, y, azs in points:
+            cells.setdefault((floor(x * scale), floor(y * scale)), []).append(azs)
+
+        for (cell_x, cell_y), members in cells.items():
+            tile = self.tiles.setdefault(
+                (
+                    zoom,
+                    cell_x // CLUSTERS_PER_TILE_SIDE,
+                    cell_y // CLUSTERS_PER_TILE_SIDE,
+                ),
+                {"clusters": [], "markers": []},
+            )
+            if len(members) == 1:
+                tile["markers"].append(_marker(members[0]))
+                continue
+            tile["clusters"].append(
+                {
+                    "lat": round(sum(azs.lat for azs in members) / len(members), 6),
+                    "lon": round(sum(azs.lon for azs in members) / len(members), 6),
+                    "count": len(members),
+                }
+            )
+
+    def _markers(self, zoom: int, x: int, y: int) -> Optional[dict]:
+        shift = zoom - (MAX_CLUSTER_ZOOM + 1)
+        scale = 1 << zoom
+        markers = [
+            _marker(azs)
+            for px, py, azs in self._leaves.get((x >> shift, y >> shift), ())
+            if floor(px * scale) == x and floor(py * scale) == y
+        ]
+        return {"clusters": [], "markers": markers} if markers else None
+
+    def get(self, zoom: int, x: int, y: int) -> CachedResponse:
+        """Готовый JSON тайла (одинаковый пустой ответ для тайлов без АЗС)"""
+        key = (zoom, x, y)
+        cached = self._responses.get(key)
+        if cached is not None:
+            return cached
+
+        if zoom <= MAX_CLUSTER_ZOOM:
+            tile = self.tiles.get(key)
+        else:
+            tile = self._markers(zoom, x, y)
+        if tile is None:
+            return EMPTY_TILE
+
+        cached = CachedResponse(orjson.dumps(tile))
+        self._responses[key] = cached
+        return cached
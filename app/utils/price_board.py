@@ -0,0 +1,352 @@
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.response_cache import CachedResponse
+from app.utils.station_records import Station
+from app.utils.station_snapshot import StationSnapshot
+
+# Сколько новых цен вида топлива вставлять по одной; при большем числе
+# массив цен сортируется заново целиком
+MERGE_INSERT_ROWS = 64
+
+
+def settings_key(settings) -> Optional[tuple]:
+    """Версия настроек скидки, от которой зависят итоговые цены"""
+    if not settings:
+        return None
+    return settings.discount_type, float(settings.discount_value)
+
+
+def apply_discount(prices: np.ndarray, discount: Optional[tuple]) -> np.ndarray:
+    """Применяет скидку сразу ко всему массиву цен (NaN - цена неизвестна)"""
+    if discount is None:
+        return prices
+    discount_type, discount_value = discount
+    if discount_type == "percent":
+        return prices * (1 - discount_value / 100)
+    if discount_type == "fixed":
+        return np.maximum(0, prices - discount_value)
+    return prices
+
+
+def _merged_prices(
+    prices: np.ndarray,
+    ids: np.ndarray,
+    removed_ids: np.ndarray,
+    rows: List[Tuple[float, int]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Упорядоченные по (цене, ID) массивы без removed_ids и со строками rows
+
+    Массивы уже упорядочены, поэтому немногие новые строки вставляются на
+    свои места двоичным поиском, без сортировки всего массива заново.
+    """
+    keep = ~np.isin(ids, removed_ids)
+    prices, ids = prices[keep], ids[keep]
+    if len(rows) > MERGE_INSERT_ROWS:
+        prices = np.concatenate((prices, [row[0] for row in rows]))
+        ids = np.concatenate((ids, np.array([row[1] for row in rows], dtype=ids.dtype)))
+        order = np.lexsort((ids, prices))
+        return prices[order], ids[order]
+
+    rows = sorted(rows)
+    positions = []
+    for price, azs_id in rows:
+        start = np.searchsorted(prices, price, side="left")
+        end = np.searchsorted(prices, price, side="right")
+        positions.append(start + np.searchsorted(ids[start:end], azs_id))
+    return (
+        np.insert(prices, positions, [row[0] for row in rows]),
+        np.insert(ids, positions, [row[1] for row in rows]),
+    )
+
+
+class PriceBoard:
+    """Табло итоговых цен всех АЗС со скидкой, построенное один раз
+
+    Строится для конкретной версии снимка АЗС, справочника топлива и
+    настроек скидки; запросы к нему - только чтение готовых словарей.
+    Вместе с табло живут и готовые JSON-ответы по его данным.
+
+    Если снимок получен из снимка предыдущего табло (previous) при тех же
+    справочнике и скидке, пересчитываются только измененные АЗС, а строки
+    и готовые ответы остальных переходят в новое табло.
+    """
+
+    def __init__(
+        self,
+        snapshot: StationSnapshot,
+        fuel_types: dict,
+        fuel_types_version: int,
+        settings,
+        previous: Optional["PriceBoard"] = None,
+    ):
+        self.snapshot = snapshot
+        self.discount = settings_key(settings)
+        self.key = (snapshot.version, fuel_types_version, self.discount)
+
+        self.responses: Dict[tuple, CachedResponse] = {}
+        self.by_id: Dict[int, dict] = {}
+        # Цены со скидкой по АЗС и виду топлива (только известные цены)
+        self.prices: Dict[int, Dict[int, float]] = {}
+        # Цены со скидкой по каждому виду топлива, отсортированные по
+        # возрастанию, для поиска по диапазону цен двоичным поиском
+        self.fuel_prices: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+        if (
+            previous is not None
+            and previous.snapshot.version == snapshot.previous_version
+            and previous.key[1:] == self.key[1:]
+        ):
+            self._update(previous, fuel_types)
+        else:
+            self._build(fuel_types)
+
+    def _build(self, fuel_types: dict):
+        fuel_price_rows = self._add_stations(self.snapshot.by_id.values(), fuel_types)
+        for fuel_type_id, rows in fuel_price_rows.items():
+            rows.sort()
+            self.fuel_prices[fuel_type_id] = (
+                np.array([row[0] for row in rows], dtype=float),
+                np.array([row[1] for row in rows]),
+            )
+
+        # Виды топлива по группам фильтра (например, «Бензин»)
+        self.fuel_groups: Dict[str, List[int]] = {}
+        for fuel_type_id, fuel_info in fuel_types.items():
+            group = fuel_info.get("filter_group")
+            if group:
+                self.fuel_groups.setdefault(group.casefold(), []).append(fuel_type_id)
+
+    def _add_stations(
+        self, stations: Iterable[Station], fuel_types: dict
+    ) -> Dict[int, List[Tuple[float, int]]]:
+        """Строит строки табло АЗС; возвращает их цены по видам топлива
+
+        Скидка применяется одним расчетом сразу ко всем ценам этих АЗС.
+        """
+        stations = list(stations)
+        fuels = []
+        for azs in stations:
+            fuels.extend(azs.fuel)
+        final_prices = np.array(
+            [
+                (fuel.discount_price if fuel.discount_price is not None else fuel.price)
+                for fuel in fuels
+            ],
+            dtype=float,
+        )
+        discounted = apply_discount(final_prices, self.discount).tolist()
+
+        fuel_price_rows: Dict[int, List[Tuple[float, int]]] = {}
+        position = 0
+        for azs in stations:
+            azs_id = azs.id
+            fuel_data = []
+            station_prices = self.prices[azs_id] = {}
+            for fuel in azs.fuel:
+                fuel_type_id = fuel.fuel_type_id
+                fuel_info = fuel_types.get(fuel_type_id, {})
+                price = discounted[position]
+                position += 1
+                if price == price:
+                    station_prices[fuel_type_id] = min(
+                        price, station_prices.get(fuel_type_id, price)
+                    )
+                    fuel_price_rows.setdefault(fuel_type_id, []).append((price, azs_id))
+
+                fuel_data.append(
+                    {
+                        "fuel_type_id": fuel_type_id,
+                        "name": fuel_info.get("name", f"Топливо {fuel_type_id}"),
+                        "price": fuel.price,
+                        "discount_price": None if price != price else price,
+                        "currency_code": fuel.currency_code,
+                        "updated": fuel.updated,
+                        "color": fuel_info.get("color", ""),
+                        "filter_group": fuel_info.get("filter_group", ""),
+                    }
+                )
+
+            self.by_id[azs_id] = {
+                "azs_number": azs.number,
+                "address": azs.address,
+                "region": azs.region,
+                "fuel": fuel_data,
+                "actualization_date": azs.actualization_date,
+                "id": azs_id,
+            }
+        return fuel_price_rows
+
+    def _update(self, previous: "PriceBoard", fuel_types: dict):
+        """Табло по предыдущему: пересчитываются только измененные АЗС"""
+        changed = self.snapshot.changed_ids
+        # Копия словарей целиком и удаление из нее только измененных АЗС
+        self.by_id = dict(previous.by_id)
+        self.prices = dict(previous.prices)
+        for azs_id in changed:
+            self.by_id.pop(azs_id, None)
+            self.prices.pop(azs_id, None)
+        # Готовые ответы неизмененных АЗС остаются верными
+        self.responses = {
+            key: cached
+            for key, cached in previous.responses.items()
+            if key[1] not in changed
+        }
+        fuel_price_rows = self._add_stations(
+            (
+                self.snapshot.by_id[azs_id]
+                for azs_id in sorted(changed)
+                if azs_id in self.snapshot.by_id
+            ),
+            fuel_types,
+        )
+
+        changed_ids = np.array(sorted(changed))
+        empty = (np.empty(0, dtype=float), np.empty(0, dtype=np.int64))
+        for fuel_type_id in previous.fuel_prices.keys() | fuel_price_rows.keys():
+            prices, ids = previous.fuel_prices.get(fuel_type_id, empty)
+            prices, ids = _merged_prices(
+                prices, ids, changed_ids, fuel_price_rows.get(fuel_type_id, [])
+            )
+            if len(ids):
+                self.fuel_prices[fuel_type_id] = (prices, ids)
+
+        self.fuel_groups = previous.fuel_groups
+
+    def get_response(self, key: tuple, render: Callable[[], bytes]) -> CachedResponse:
+        """Готовый JSON-ответ по ключу; render вызывается только при первом обращении
+
+        Ключ - (вид ответа, ID АЗС): по ID при обновлении табло отбрасываются
+        ответы измененных АЗС.
+        """
+        cached = self.responses.get(key)
+        if cached is None:
+            cached = CachedResponse(render())
+            self.responses[key] = cached
+        return cached
+
+    def fuel_type_ids(
+        self, fuel_type_id: Optional[int] = None, filter_group: Optional[str] = None
+    ) -> Optional[List[int]]:
+        """Виды топлива по ID или группе фильтра; None - фильтр не задан"""
+        if fuel_type_id is not None:
+            return [fuel_type_id]
+        if filter_group:
+            return self.fuel_groups.get(filter_group.casefold(), [])
+        return None
+
+    def match_fuel_prices(
+        self,
+        fuel_type_ids: Iterable[int],
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> Dict[int, Optional[float]]:
+        """АЗС с нужным топливом и минимальная подходящая цена по каждой
+
+        Без ограничений по цене в результат попадают и АЗС без известной цены
+        (со значением None).
+        """
+        matched: Dict[int, Optional[float]] = {}
+        for fuel_type_id in fuel_type_ids:
+            if min_price is None and max_price is None:
+                for azs_id in self.snapshot.by_fuel_type.get(fuel_type_id, ()):
+                    matched.setdefault(azs_id, None)
+
+            prices, ids = self.fuel_prices.get(fuel_type_id, (None, None))
+            if prices is None:
+                continue
+            start = 0 if min_price is None else np.searchsorted(prices, min_price)
+            end = (
+                len(prices)
+                if max_price is None
+                else np.searchsorted(prices, max_price, side="right")
+            )
+            for price, azs_id in zip(
+                prices[start:end].tolist(), ids[start:end].tolist()
+            ):
+                current = matched.get(azs_id)
+                if current is None or price < current:
+                    matched[azs_id] = price
+        return matched
+
+    def search(
+        self,
+        region: Optional[str] = None,
+        fuel_type_ids: Optional[List[int]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "number",
+        descending: bool = False,
+    ) -> List[Tuple[int, Optional[float]]]:
+        """Поиск АЗС по обратным индексам: список (ID, цена подходящего топлива)"""
+        if fuel_type_ids is not None:
+            matched = self.match_fuel_prices(fuel_type_ids, min_price, max_price)
+        else:
+            matched = None
+
+        if region:
+            region_ids = self.snapshot.by_region.get(region.casefold(), set())
+            if matched is None:
+                matched = dict.fromkeys(region_ids)
+            else:
+                matched = {
+                    azs_id: price
+                    for azs_id, price in matched.items()
+                    if azs_id in region_ids
+                }
+
+        if matched is None:
+            matched = dict.fromkeys(self.by_id)
+
+        if sort == "price":
+            # АЗС без известной цены всегда в конце списка
+            known = [item for item in matched.items() if item[1] is not None]
+            unknown = [item for item in matched.items() if item[1] is None]
+            known.sort(key=lambda item: (item[1], item[0]), reverse=descending)
+            return known + sorted(unknown)
+
+        if sort == "region":
+
+            def sort_key(item):
+                azs = self.by_id[item[0]]
+                return azs["region"] or "", azs["azs_number"] or 0, item[0]
+
+        else:
+
+            def sort_key(item):
+                return self.by_id[item[0]]["azs_number"] or 0, item[0]
+
+        return sorted(matched.items(), key=sort_key, reverse=descending)
+
+    def cheapest_nearby(
+        self,
+        lat: float,
+        lon: float,
+        fuel_type_ids: List[int],
+        radius_km: float,
+        k: int,
+        distance_weight: Optional[float] = None,
+    ) -> List[Tuple[float, Station, float]]:
+        """До k АЗС в радиусе с самой низкой ценой топлива: (расстояние, азс, цена)
+
+        Если задан distance_weight (руб. за км), АЗС ранжируются по цене с
+        учетом расстояния: price + distance_weight * distance.
+        """
+        candidates = []
+        for distance, azs in self.snapshot.spatial_index.within(lat, lon, radius_km):
+            station_prices = self.prices.get(azs.id, {})
+            prices = [
+                station_prices[fuel_type_id]
+                for fuel_type_id in fuel_type_ids
+                if fuel_type_id in station_prices
+            ]
+            if prices:
+                candidates.append((distance, azs, min(prices)))
+
+        if distance_weight is None:
+            key = lambda item: (item[2], item[0])
+        else:
+            key = lambda item: (item[2] + distance_weight * item[0], item[0])
+        return heapq.nsmallest(k, candidates, key=key)
@@ -1,8 +1,25 @@
-from typing import Optional
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
 from pathlib import Path
-import requests
+import aiohttp
 from datetime import datetime, timedelta
-from app.utils.file_cache import file_cache
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.utils.file_cache import CacheEntry, file_cache
+from app.utils.json_stream import JsonObjectStream
+from app.utils.price_board import PriceBoard, settings_key
+from app.utils.price_refresher import PriceRefresher
+from app.utils.single_flight import SingleFlight
+from app.utils.station_diff import StationDiff, station_changelog
+from app.utils.station_records import (
+    Station,
+    stations_from_dicts,
+    stations_to_dicts,
+)
+from app.utils.station_snapshot import StationSnapshot, station_fingerprints
+
+STREAM_CHUNK_SIZE = 64 * 1024  # Размер части тела ответа при потоковом разборе
 
 
 class PriceParser:
@@ -10,361 +27,559 @@ class PriceParser:
         self.base_url = "https://api.gs.tatneft.ru/api/v2/azs"
         self.cache_timeout = timedelta(minutes=15)
         self.long_cache_timeout = timedelta(hours=12)
+        self.request_timeout = 10
         self.fuel_types_cache = None
-        self.azs_list_cache = None
+        self.fuel_types_updated_at: Optional[datetime] = None
+        self.fuel_types_version = 0
+        self.snapshot: Optional[StationSnapshot] = None
         self.cache_expiration = None
-        self.cache_dir = Path("cache") 
+        self.cache_dir = Path("cache")
         self.cache_dir.mkdir(exist_ok=True)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
+        # Одновременные промахи кэша ждут один общий запрос к API
+        self._single_flight = SingleFlight()
+        # При недоступности API запросы сразу получают кэш, не ожидая таймаута
+        self.breaker = CircuitBreaker("api.gs.tatneft.ru", self.request_timeout)
+
+        # Срок свежести данных по ключам; после него данные обновляются в фоне
+        self.refresh_ttl = {
+            "azs_list": self.cache_timeout,
+            "fuel_types": self.long_cache_timeout,
+        }
+        # Сколько после истечения срока можно отдавать устаревшие данные
+        self.max_staleness = timedelta(
+            seconds=int(os.getenv("PRICE_MAX_STALENESS", "3600"))
+        )
+        self.refresher = PriceRefresher(self)
+        self._price_board: Optional[PriceBoard] = None
+
+    @property
+    def azs_list_cache(self):
+        """Список АЗС из текущего снимка (None, если снимок не загружен)"""
+        return self.snapshot.stations if self.snapshot is not None else None
+
+    def _set_azs_list(self, azs_list, updated_at: Optional[datetime] = None):
+        """Атомарно заменяет снимок списка АЗС вместе с его индексами
+
+        Принимает список словарей (из файлового кэша) и хранит их проекцию.
+        """
+        self.snapshot = (
+            StationSnapshot(stations_from_dicts(azs_list), updated_at)
+            if azs_list is not None
+            else None
+        )
 
-    def get_azs_list(
-        self, use_cache_on_error: bool = True, force_refresh: bool = False
-    ):
-        """Получает и кэширует список всех АЗС с проверкой времени обновления"""
-        current_time = datetime.now()
+    def _set_fuel_types(self, fuel_types, updated_at: Optional[datetime] = None):
+        if fuel_types != self.fuel_types_cache:
+            # Табло цен зависит от названий и групп топлива
+            self.fuel_types_version += 1
+        self.fuel_types_cache = fuel_types
+        self.fuel_types_updated_at = (
+            (updated_at or datetime.now()) if fuel_types is not None else None
+        )
 
-        # Проверяем, нужно ли принудительное обновление из-за устаревшего кэша
-        if not force_refresh:
-            cache_age = file_cache.get_last_updated("azs_list")
-            if cache_age and (current_time - cache_age) > self.long_cache_timeout:
-                print("Кэш списка АЗС устарел (старше 12 часов), обновляем...")
-                force_refresh = True
+    def data_updated_at(self, key: str) -> Optional[datetime]:
+        """Время получения данных в памяти по ключу (None, если не загружены)"""
+        if key == "azs_list":
+            snapshot = self.snapshot
+            return snapshot.updated_at if snapshot is not None else None
+        return self.fuel_types_updated_at
+
+    def data_age(self, key: str) -> Optional[timedelta]:
+        """Возраст данных в памяти по ключу (None, если данные не загружены)"""
+        updated_at = self.data_updated_at(key)
+        return datetime.now() - updated_at if updated_at is not None else None
+
+    def refresh_in_flight(self, key: str) -> bool:
+        return self._single_flight.in_flight(key)
+
+    async def refresh_async(self, key: str):
+        """Обновляет данные по ключу (с объединением одновременных вызовов)
+
+        Если другой воркер уже обновил данные в общем файловом кэше, они
+        берутся оттуда, и запрос к серверу не выполняется.
+        """
+        refresh = {
+            "azs_list": self._refresh_azs_list,
+            "fuel_types": self._refresh_fuel_types,
+        }[key]
+
+        async def adopt_or_refresh():
+            adopted = await self._adopt_shared(key)
+            return adopted if adopted is not None else await refresh()
+
+        return await self._single_flight.do_async(key, adopt_or_refresh)
+
+    async def _adopt_shared(self, key: str):
+        """Данные из общего кэша, если они новее своих и еще не требуют обновления"""
+        updated_at = await file_cache.get_last_updated_async(key)
+        if updated_at is None:
+            return None
+        due_after = self.refresh_ttl[key] - self.refresher.refresh_ahead
+        if datetime.now() - updated_at >= due_after:
+            return None
+        own_updated_at = self.data_updated_at(key)
+        if own_updated_at is not None and own_updated_at >= updated_at:
+            return None
+
+        entry = await file_cache.get_entry_async(key)
+        if entry is None or not entry.value:
+            return None
+        print(f"Данные {key} уже обновлены другим воркером, берем из общего кэша")
+        if key == "azs_list":
+            data = {"status": "success", "data": stations_from_dicts(entry.value)}
+            return self._store_azs_list(data, entry.updated_at)
+        self._set_fuel_types(self._convert_fuel_types(entry.value), entry.updated_at)
+        return self.fuel_types_cache
+
+    def _stale_while_revalidate(self, key: str, value):
+        """Отдает данные из памяти, пока они не старше срока + max_staleness
+
+        Если срок свежести уже истек, запускает фоновое обновление.
+        Возвращает None, если данных нет или они слишком устарели.
+        """
+        age = self.data_age(key)
+        if value is None or age is None:
+            return None
+
+        ttl = self.refresh_ttl[key]
+        if age > ttl + self.max_staleness:
+            return None
+        if age > ttl:
+            self.refresher.trigger(key)
+        return value
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общий keep-alive клиент для запросов к API Татнефти"""
+        loop = asyncio.get_running_loop()
+        if (
+            self._session is None
+            or self._session.closed
+            or self._session_loop is not loop
+        ):
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        """Закрывает HTTP-клиент (вызывается при остановке приложения)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    async def _call_upstream(self, fetch: Callable[[float], Awaitable[Any]]):
+        """Вызывает API Татнефти через выключатель; fetch получает срок вызова"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("API Татнефти временно недоступно")
+        started = time.monotonic()
+        try:
+            result = await fetch(self.breaker.timeout())
+        except BaseException as e:
+            self.breaker.record_failure(time.monotonic() - started, e)
+            raise
+        self.breaker.record_success(time.monotonic() - started)
+        return result
 
-        # Если не принудительное обновление, проверяем актуальность кэша в памяти
-        if not force_refresh and (
+    async def _fetch_json(self, url: str):
+        async def fetch(timeout: float):
+            async with self._get_session().get(
+                url, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+        return await self._call_upstream(fetch)
+
+    @staticmethod
+    def _collect_azs_list(parsed, data: dict):
+        """Добавляет разобранные поля ответа со списком АЗС в data
+
+        В проекцию попадают только объекты из списка data; любое другое
+        значение data (например, null в ответе с ошибкой) сохраняется как
+        есть и обрабатывается проверкой статуса ответа.
+        """
+        for key, value, is_item in parsed:
+            if not is_item:
+                data[key] = value
+            elif isinstance(value, dict):
+                # Лишние поля станции отбрасываются сразу, не накапливаясь
+                data["data"].append(Station.from_dict(value))
+
+    async def _fetch_azs_list(self, url: str) -> dict:
+        """Загружает список АЗС с потоковым разбором тела ответа"""
+
+        async def fetch(timeout: float):
+            stream = JsonObjectStream("data")
+            data = {"data": []}
+            async with self._get_session().get(
+                url, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    self._collect_azs_list(stream.feed(chunk), data)
+            self._collect_azs_list(stream.close(), data)
+            return data
+
+        return await self._call_upstream(fetch)
+
+    def _azs_list_too_old(
+        self, cache_age: Optional[datetime], current_time: datetime
+    ) -> bool:
+        """Нужно ли принудительное обновление из-за устаревшего кэша"""
+        if cache_age and (current_time - cache_age) > self.long_cache_timeout:
+            print("Кэш списка АЗС устарел (старше 12 часов), обновляем...")
+            return True
+        return False
+
+    def _memory_azs_list(self, current_time: datetime):
+        """Список АЗС из памяти, если срок его актуальности не истек"""
+        if (
             self.azs_list_cache is not None
             and self.cache_expiration is not None
             and current_time < self.cache_expiration
         ):
             return self.azs_list_cache
+        return None
+
+    def _azs_list_from_entry(self, entry: Optional[CacheEntry]):
+        """Загружает список АЗС из свежей записи файлового кэша"""
+        if entry and entry.value and entry.is_fresh(file_cache.cache_timeout):
+            self._set_azs_list(entry.value, entry.updated_at)
+            return self.azs_list_cache
+        return None
+
+    async def _cached_azs_list(self, current_time: datetime, force_refresh: bool):
+        """Ищет актуальный список АЗС в памяти и в файловом кэше
 
-        # Проверяем файловый кэш (если не требуется принудительное обновление)
+        Возвращает пару (список или None, force_refresh с учетом возраста кэша).
+        """
         if not force_refresh:
-            cached_data = file_cache.get("azs_list")
-            if cached_data:
-                self.azs_list_cache = cached_data
+            cache_age = await file_cache.get_last_updated_async("azs_list")
+            force_refresh = self._azs_list_too_old(cache_age, current_time)
+        if force_refresh:
+            return None, force_refresh
+
+        cached = self._memory_azs_list(current_time)
+        if cached is None:
+            entry = await file_cache.get_entry_async("azs_list")
+            cached = self._azs_list_from_entry(entry)
+            if cached is not None:
                 self.cache_expiration = datetime.now() + self.cache_timeout
-                return self.azs_list_cache
+        return cached, force_refresh
 
-        try:
-            # Запрос к API для обновления данных
-            print("Обновление данных списка АЗС с сервера...")
-            response = requests.get(f"{self.base_url}/", timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("status") == "success":
-                self.azs_list_cache = data.get("data", [])
-                self.cache_expiration = current_time + self.cache_timeout
-                file_cache.set("azs_list", self.azs_list_cache)
-                print("Данные списка АЗС успешно обновлены")
-                return self.azs_list_cache
+    def _store_azs_list(self, data, current_time: datetime):
+        """Применяет ответ API со списком АЗС к снимку в памяти
+
+        Возвращает список АЗС; None, если API вернуло ошибку.
+        """
+        if data.get("status") != "success" or not isinstance(
+            data.get("data", []), list
+        ):
+            return None
+
+        previous = self.snapshot
+        stations = data.get("data", [])
+        # Отпечатки считаются до построения снимка: без изменений индексы
+        # не перестраиваются
+        fingerprints = station_fingerprints(stations)
+
+        if previous is None:
+            # Предыдущей версии нет - сравнивать не с чем
+            station_changelog.record(None, len(stations))
+            self.snapshot = StationSnapshot(stations, current_time, fingerprints)
+        else:
+            diff = StationDiff(previous.fingerprints, fingerprints)
+            station_changelog.record(diff, len(stations))
+            if diff.is_empty:
+                # Ничего не изменилось: оставляем снимок и его индексы
+                previous.updated_at = current_time
             else:
-                # Если API вернуло ошибку, используем кэш если разрешено
-                if use_cache_on_error and not force_refresh:
-                    cached_data = file_cache.get("azs_list")
-                    if cached_data:
-                        print("Используем кэшированные данные из-за ошибки API")
-                        self.azs_list_cache = cached_data
-                        return self.azs_list_cache
-                return []
-        except Exception as e:
-            print(f"Ошибка при получении списка АЗС: {e}")
-            # Используем кэш при ошибке, если разрешено и не требуется принудительное обновление
-            if use_cache_on_error and not force_refresh:
-                cached_data = file_cache.get("azs_list")
-                if cached_data:
-                    print("Используем кэшированные данные из-за ошибки соединения")
-                    self.azs_list_cache = cached_data
-                    return self.azs_list_cache
-            return []
-
-    def get_fuel_types(
+                # Индексы и табло цен обновляются только для измененных АЗС
+                self.snapshot = StationSnapshot(
+                    stations, current_time, fingerprints, previous, diff
+                )
+            print(
+                f"Изменения списка АЗС: добавлено {len(diff.added)}, "
+                f"удалено {len(diff.removed)}, изменено {len(diff.changed)}"
+            )
+
+        self.cache_expiration = current_time + self.cache_timeout
+        return self.azs_list_cache
+
+    async def _write_azs_list_cache(self):
+        """Сохраняет снимок АЗС в файловый кэш"""
+        await file_cache.set_async(
+            "azs_list", stations_to_dicts(self.snapshot.stations)
+        )
+        print("Данные списка АЗС успешно обновлены")
+
+    async def _azs_list_fallback(
+        self, use_cache_on_error: bool, force_refresh: bool, reason: str
+    ):
+        """Возвращает кэшированный список АЗС после ошибки обновления"""
+        # Используем кэш при ошибке, если разрешено и не требуется принудительное обновление
+        if use_cache_on_error and not force_refresh:
+            if self.azs_list_cache is not None:
+                return self.azs_list_cache
+            entry = await file_cache.get_entry_async("azs_list")
+            cached = self._azs_list_from_entry(entry)
+            if cached is not None:
+                print(f"Используем кэшированные данные из-за ошибки {reason}")
+                return cached
+        return []
+
+    async def _refresh_azs_list(self):
+        """Загружает список АЗС с сервера; None, если API вернуло ошибку"""
+        print("Обновление данных списка АЗС с сервера...")
+        data = await self._fetch_azs_list(f"{self.base_url}/")
+        azs_list = self._store_azs_list(data, datetime.now())
+        if azs_list is not None:
+            await self._write_azs_list_cache()
+        return azs_list
+
+    async def get_azs_list_async(
         self, use_cache_on_error: bool = True, force_refresh: bool = False
     ):
-        """Получает и кэширует справочник типов топлива с проверкой времени обновления"""
-        current_time = datetime.now()
+        """Получает и кэширует список всех АЗС, не блокируя цикл событий
 
-        # Проверяем, нужно ли принудительное обновление из-за устаревшего кэша
+        Пока данные в памяти не старше допустимого, отдает их сразу,
+        а обновление с сервера выполняет в фоне.
+        """
         if not force_refresh:
-            cache_age = file_cache.get_last_updated("fuel_types")
-            if cache_age and (current_time - cache_age) > self.long_cache_timeout:
-                print("Кэш типов топлива устарел (старше 12 часов), обновляем...")
-                force_refresh = True
+            stale = self._stale_while_revalidate("azs_list", self.azs_list_cache)
+            if stale is not None:
+                return stale
+
+        current_time = datetime.now()
+        cached, force_refresh = await self._cached_azs_list(current_time, force_refresh)
+        if cached is not None:
+            return cached
+
+        try:
+            azs_list = await self._single_flight.do_async(
+                "azs_list", self._refresh_azs_list
+            )
+        except Exception as e:
+            print(f"Ошибка при получении списка АЗС: {e}")
+            return await self._azs_list_fallback(
+                use_cache_on_error, force_refresh, "соединения"
+            )
 
-        if not force_refresh and self.fuel_types_cache is not None:
+        if azs_list is not None:
+            return azs_list
+        return await self._azs_list_fallback(use_cache_on_error, force_refresh, "API")
+
+    @staticmethod
+    def _convert_fuel_types(cached_data) -> dict:
+        """Восстанавливает справочник топлива из файлового кэша"""
+        # Извлекаем данные из правильной структуры кэша
+        fuel_data = cached_data.get("data", {})
+        # Конвертируем строковые ключи в числа
+        converted_data = {}
+        for key, value in fuel_data.items():
+            try:
+                num_key = int(key)
+                converted_data[num_key] = value
+            except ValueError:
+                converted_data[key] = value
+        return converted_data
+
+    def _fuel_types_too_old(
+        self, cache_age: Optional[datetime], current_time: datetime
+    ) -> bool:
+        """Нужно ли принудительное обновление из-за устаревшего кэша"""
+        if cache_age and (current_time - cache_age) > self.long_cache_timeout:
+            print("Кэш типов топлива устарел (старше 12 часов), обновляем...")
+            return True
+        return False
+
+    def _fuel_types_from_entry(self, entry: Optional[CacheEntry]):
+        """Загружает справочник топлива из свежей записи файлового кэша"""
+        if entry and entry.value and entry.is_fresh(file_cache.cache_timeout):
+            self._set_fuel_types(
+                self._convert_fuel_types(entry.value), entry.updated_at
+            )
             return self.fuel_types_cache
+        return None
+
+    async def _cached_fuel_types(self, current_time: datetime, force_refresh: bool):
+        """Ищет справочник топлива в памяти и в файловом кэше
 
-        # Проверяем файловый кэш (если не требуется принудительное обновление)
+        Возвращает пару (справочник или None, force_refresh с учетом возраста кэша).
+        """
         if not force_refresh:
-            cached_data = file_cache.get("fuel_types")
-            if cached_data:
-                # Извлекаем данные из правильной структуры кэша
-                fuel_data = cached_data.get("data", {})
-                # Конвертируем строковые ключи в числа
-                converted_data = {}
-                for key, value in fuel_data.items():
-                    try:
-                        num_key = int(key)
-                        converted_data[num_key] = value
-                    except ValueError:
-                        converted_data[key] = value
-                self.fuel_types_cache = converted_data
+            cache_age = await file_cache.get_last_updated_async("fuel_types")
+            force_refresh = self._fuel_types_too_old(cache_age, current_time)
+        if force_refresh:
+            return None, force_refresh
+
+        if self.fuel_types_cache is not None:
+            return self.fuel_types_cache, force_refresh
+        entry = await file_cache.get_entry_async("fuel_types")
+        return self._fuel_types_from_entry(entry), force_refresh
+
+    def _store_fuel_types(self, data):
+        """Применяет ответ API со справочником топлива; None, если API вернуло ошибку"""
+        if data.get("status") != "success":
+            return None
+
+        fuel_types = {}
+        for item in data.get("data", {}).get("items", []):
+            fuel_id = item["id"]
+            fuel_types[fuel_id] = {
+                "name": item["title"],
+                "color": item.get("color", ""),
+                "filter_group": item.get("filter_group_title", ""),
+            }
+        self._set_fuel_types(fuel_types)
+        return self.fuel_types_cache
+
+    async def _fuel_types_fallback(
+        self, use_cache_on_error: bool, force_refresh: bool, reason: str
+    ):
+        """Возвращает кэшированный справочник топлива после ошибки обновления"""
+        if use_cache_on_error and not force_refresh:
+            if self.fuel_types_cache is not None:
                 return self.fuel_types_cache
+            entry = await file_cache.get_entry_async("fuel_types")
+            cached = self._fuel_types_from_entry(entry)
+            if cached is not None:
+                print(
+                    f"Используем кэшированные данные типов топлива из-за ошибки {reason}"
+                )
+                return cached
+        return {}
+
+    async def _refresh_fuel_types(self):
+        """Загружает справочник топлива с сервера; None, если API вернуло ошибку"""
+        print("Обновление данных типов топлива с сервера...")
+        data = await self._fetch_json(f"{self.base_url}/fuel_types/")
+        fuel_types = self._store_fuel_types(data)
+        if fuel_types is not None:
+            await file_cache.set_async("fuel_types", {"data": fuel_types})
+            print("Данные типов топлива успешно обновлены")
+        return fuel_types
+
+    async def get_fuel_types_async(
+        self, use_cache_on_error: bool = True, force_refresh: bool = False
+    ):
+        """Получает и кэширует справочник типов топлива, не блокируя цикл событий
+
+        Пока данные в памяти не старше допустимого, отдает их сразу,
+        а обновление с сервера выполняет в фоне.
+        """
+        if not force_refresh:
+            stale = self._stale_while_revalidate("fuel_types", self.fuel_types_cache)
+            if stale is not None:
+                return stale
+
+        current_time = datetime.now()
+        cached, force_refresh = await self._cached_fuel_types(
+            current_time, force_refresh
+        )
+        if cached is not None:
+            return cached
 
         try:
-            # Запрос к API для обновления данных
-            print("Обновление данных типов топлива с сервера...")
-            response = requests.get(f"{self.base_url}/fuel_types/", timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("status") == "success":
-                self.fuel_types_cache = {}
-                for item in data.get("data", {}).get("items", []):
-                    fuel_id = item["id"]
-                    self.fuel_types_cache[fuel_id] = {
-                        "name": item["title"],
-                        "color": item.get("color", ""),
-                        "filter_group": item.get("filter_group_title", ""),
-                    }
-                # Сохраняем в правильном формате
-                file_cache.set("fuel_types", {"data": self.fuel_types_cache})
-                print("Данные типов топлива успешно обновлены")
-                return self.fuel_types_cache
-            else:
-                # Если API вернуло ошибку, используем кэш если разрешено
-                if use_cache_on_error and not force_refresh:
-                    cached_data = file_cache.get("fuel_types")
-                    if cached_data:
-                        print(
-                            "Используем кэшированные данные типов топлива из-за ошибки API"
-                        )
-                        fuel_data = cached_data.get("data", {})
-                        converted_data = {}
-                        for key, value in fuel_data.items():
-                            try:
-                                num_key = int(key)
-                                converted_data[num_key] = value
-                            except ValueError:
-                                converted_data[key] = value
-                        self.fuel_types_cache = converted_data
-                        return self.fuel_types_cache
-                return {}
+            fuel_types = await self._single_flight.do_async(
+                "fuel_types", self._refresh_fuel_types
+            )
         except Exception as e:
             print(f"Ошибка при получении справочника топлива: {e}")
-            # Используем кэш при ошибке, если разрешено и не требуется принудительное обновление
-            if use_cache_on_error and not force_refresh:
-                cached_data = file_cache.get("fuel_types")
-                if cached_data:
-                    print(
-                        "Используем кэшированные данные типов топлива из-за ошибки соединения"
-                    )
-                    fuel_data = cached_data.get("data", {})
-                    converted_data = {}
-                    for key, value in fuel_data.items():
-                        try:
-                            num_key = int(key)
-                            converted_data[num_key] = value
-                        except ValueError:
-                            converted_data[key] = value
-                    self.fuel_types_cache = converted_data
-                    return self.fuel_types_cache
-            return {}
-
-    def get_azs_data_with_discount(
-        self,
-        azs_number: int,
-        settings,
-        azs_id: Optional[int] = None,
-        force_refresh: bool = False,
-    ):
-        """Получает данные конкретной АЗС с применением скидки и проверкой времени обновления"""
-        # Формируем ключ кэша только если указан конкретный azs_id
-        cache_key = f"azs_{azs_number}_{azs_id}" if azs_id else None
-
-        # Проверяем, нужно ли принудительное обновление из-за устаревшего кэша
-        if cache_key and not force_refresh:
-            cache_age = file_cache.get_last_updated(cache_key)
-            if cache_age and (datetime.now() - cache_age) > self.long_cache_timeout:
-                print(f"Кэш АЗС {azs_number} (ID: {azs_id}) устарел, обновляем...")
-                force_refresh = True
-
-        cached_data = (
-            file_cache.get(cache_key) if cache_key and not force_refresh else None
-        )
+            return await self._fuel_types_fallback(
+                use_cache_on_error, force_refresh, "соединения"
+            )
 
-        print(
-            f"Поиск АЗС: номер={azs_number}, ID={azs_id}, ключ_кэша={cache_key}, force_refresh={force_refresh}"
-        )
+        if fuel_types is not None:
+            return fuel_types
+        return await self._fuel_types_fallback(use_cache_on_error, force_refresh, "API")
+
+    def get_price_board(self, settings) -> Optional[PriceBoard]:
+        """Табло цен для текущих снимка АЗС, справочника топлива и настроек
+
+        Пересчитывается только при смене версии любого из них (после
+        обновления списка АЗС - только для измененных АЗС); None, если
+        список АЗС не загружен.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+
+        board = self._price_board
+        key = (snapshot.version, self.fuel_types_version, settings_key(settings))
+        if board is None or board.key != key:
+            board = PriceBoard(
+                snapshot,
+                self.fuel_types_cache or {},
+                self.fuel_types_version,
+                settings,
+                previous=board,
+            )
+            self._price_board = board
+        return board
 
-        # Если есть актуальный кэш для конкретной АЗС, используем его
-        if cached_data and not force_refresh:
-            print(f"Используются кэшированные данные для ключа: {cache_key}")
-            azs_data = cached_data
-        else:
-            try:
-                # Получаем список АЗС (может также обновиться, если устарел)
-                azs_list = self.get_azs_list(
-                    use_cache_on_error=True, force_refresh=force_refresh
-                )
-                if not azs_list:
-                    return {"error": "Не удалось загрузить список АЗС"}
-
-                # Ищем нужную АЗС с учетом ID
-                target_azs = None
-                for azs in azs_list:
-                    if azs.get("number") == azs_number:
-                        # Если указан azs_id, проверяем точное соответствие
-                        if azs_id is not None:
-                            if azs.get("id") == azs_id:
-                                target_azs = azs
-                                break
-                        else:
-                            # Если azs_id не указан, берем первую попавшуюся АЗС
-                            target_azs = azs
-                            break
-
-                if not target_azs:
-                    return {
-                        "error": f"АЗС с номером {azs_number} и ID {azs_id} не найдена"
-                    }
+    async def warm_up(self, settings) -> Optional[PriceBoard]:
+        """Прогрев при запуске: снимок АЗС с индексами, справочник и табло цен
 
-                print(
-                    f"Найдена АЗС: ID={target_azs.get('id')}, адрес={target_azs.get('address')}"
-                )
+        Данные берутся из файлового кэша, а если его нет - с сервера.
+        """
+        board = await self.get_price_board_async(settings)
+        if board is None:
+            print("Прогрев кэша цен: список АЗС не загружен")
+        else:
+            print(f"Прогрев кэша цен: загружено АЗС: {len(board.by_id)}")
+        return board
+
+    def readiness(self) -> dict:
+        """Готовность данных к обслуживанию запросов (для балансировщика)"""
+        snapshot = self.snapshot
+        age = self.data_age("azs_list")
+        return {
+            "ready": snapshot is not None and self.fuel_types_cache is not None,
+            "stations": len(snapshot.stations) if snapshot is not None else 0,
+            "data_age_seconds": round(age.total_seconds()) if age else None,
+            "upstream": self.breaker.state,
+        }
 
-                azs_data = {
-                    "azs_number": target_azs.get("number"),
-                    "address": target_azs.get("address"),
-                    "region": target_azs.get("region"),
-                    "fuel": target_azs.get("fuel", []),
-                    "actualization_date": target_azs.get("actualization_date"),
-                    "id": target_azs.get("id"),
-                }
-
-                # Сохраняем в кэш ТОЛЬКО если указан конкретный azs_id
-                if cache_key:
-                    file_cache.set(cache_key, azs_data)
-                    print(f"Данные АЗС сохранены в кэш с ключом: {cache_key}")
-
-            except Exception as e:
-                print(f"Ошибка при обновлении данных АЗС {azs_number}: {e}")
-                # Если при обновлении произошла ошибка, используем кэшированные данные
-                if cached_data:
-                    print(
-                        f"Используются кэшированные данные для АЗС {azs_number} (ID: {azs_id})"
-                    )
-                    azs_data = cached_data
-                else:
-                    return {
-                        "error": f"Не удалось загрузить данные для АЗС {azs_number}"
-                    }
-
-        # Получаем типы топлива (может также обновиться, если устарел)
-        fuel_types = self.get_fuel_types(
+    async def get_price_board_async(
+        self, settings, force_refresh: bool = False
+    ) -> Optional[PriceBoard]:
+        """Загружает данные (при необходимости) и возвращает табло цен"""
+        azs_list = await self.get_azs_list_async(
             use_cache_on_error=True, force_refresh=force_refresh
         )
-        fuel_data = []
-
-        for fuel in azs_data.get("fuel", []):
-            fuel_type_id = fuel.get("fuel_type_id")
-            price = fuel.get("price")
-            discount_price = fuel.get("discount_price")
-
-            final_price = discount_price if discount_price is not None else price
-            discounted_price = final_price
-
-            if final_price is not None and settings:
-                if settings.discount_type == "percent":
-                    discounted_price = final_price * (1 - settings.discount_value / 100)
-                elif settings.discount_type == "fixed":
-                    discounted_price = max(0, final_price - settings.discount_value)
-
-            fuel_info = fuel_types.get(fuel_type_id, {})
-
-            fuel_data.append(
-                {
-                    "fuel_type_id": fuel_type_id,
-                    "name": fuel_info.get("name", f"Топливо {fuel_type_id}"),
-                    "price": price,
-                    "discount_price": discounted_price,
-                    "currency_code": fuel.get("currency_code", "rub"),
-                    "updated": fuel.get("updated"),
-                    "color": fuel_info.get("color", ""),
-                    "filter_group": fuel_info.get("filter_group", ""),
-                }
-            )
-
-        result = {
-            "azs_number": azs_data.get("azs_number"),
-            "address": azs_data.get("address"),
-            "region": azs_data.get("region"),
-            "fuel": fuel_data,
-            "actualization_date": azs_data.get("actualization_date"),
-            "id": azs_data.get("id"),
-        }
+        await self.get_fuel_types_async(
+            use_cache_on_error=True, force_refresh=force_refresh
+        )
+        if not azs_list:
+            return None
+        return self.get_price_board(settings)
 
-        return result
+    async def force_refresh_all_cache_async(self) -> bool:
+        """Принудительное обновление всех кэшей
 
-    def force_refresh_all_cache(self):
-        """Принудительное обновление всех кэшей"""
+        Данные в памяти заменяются только после успешной загрузки: если API
+        недоступно, по-прежнему отдаются последние полученные данные.
+        Возвращает False, если обновить удалось не все.
+        """
         print("Принудительное обновление всех кэшей...")
 
-        # Очищаем кэш в памяти
-        self.azs_list_cache = None
-        self.fuel_types_cache = None
-        self.cache_expiration = None
+        refreshed = True
+        for key in ("azs_list", "fuel_types"):
+            # Через фоновое обновление: результат попадает и в его статус
+            if not await self.refresher.refresh(key):
+                refreshed = False
 
-        # Получаем данные с принудительным обновлением
-        self.get_azs_list(force_refresh=True)
-        self.get_fuel_types(force_refresh=True)
+        if refreshed:
+            print("Все кэши успешно обновлены")
+        return refreshed
 
-        print("Все кэши успешно обновлены")
 
-    def clear_azs_cache(self, azs_number: int, azs_id: Optional[int] = None):
-        """Очищает кэш для конкретной АЗС через FileCache"""
-        if azs_id:
-            # Очищаем кэш только для конкретной АЗС
-            cache_key = f"azs_{azs_number}_{azs_id}"
-            file_cache.delete(cache_key)
-            print(f"Кэш очищен для АЗС {azs_number} (ID: {azs_id})")
-        else:
-            # Если azs_id не указан, находим все АЗС с этим номером и очищаем их кэш
-            azs_list = self.get_azs_list(use_cache_on_error=True)
-            if azs_list:
-                for azs in azs_list:
-                    if azs.get("number") == azs_number:
-                        azs_id = azs.get("id")
-                        cache_key = f"azs_{azs_number}_{azs_id}"
-                        file_cache.delete(cache_key)
-                        print(f"Кэш очищен для АЗС {azs_number} (ID: {azs_id})")
-
-    def clear_all_cache(self):
-        """Очищает весь кэш АЗС"""
-        try:
-            # Очищаем кэш в памяти
-            self.azs_list_cache = None
-            self.fuel_types_cache = None
-            self.cache_expiration = None
-
-            # Очищаем файловый кэш через file_cache
-            file_cache_files = ["azs_list", "fuel_types"]
-
-            # Добавляем все возможные ключи azs_*
-            import os
-
-            if os.path.exists("cache"):
-                for file in os.listdir("cache"):
-                    if file.startswith("azs_") and file.endswith(".json"):
-                        cache_key = file.replace(".json", "")
-                        file_cache_files.append(cache_key)
-
-            # Удаляем каждый файл кэша
-            for key in file_cache_files:
-                file_path = Path("cache") / f"{key}.json"
-                if file_path.exists():
-                    file_path.unlink()
-
-            print("Полная очистка кэша АЗС выполнена")
-        except Exception as e:
-            print(f"Ошибка при полной очистке кэша: {e}")
+# Единый на процесс сервис данных цен: один снимок АЗС, одни индексы и табло,
+# общий для всех роутеров кэш
+price_parser = PriceParser()
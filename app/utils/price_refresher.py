@@ -0,0 +1,131 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+
+class PriceRefresher:
+    """Фоновое обновление списка АЗС и справочника топлива
+
+    Обновляет данные заранее, до истечения срока кэша, чтобы запросы
+    пользователей обслуживались из памяти и не ждали API Татнефти.
+    Фоновое обновление также запускается из запросов, получивших
+    устаревшие (но еще допустимые) данные.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        # Как часто проверять, не пора ли обновить данные
+        self.interval = int(os.getenv("PRICE_REFRESH_INTERVAL", "60"))
+        # За сколько до истечения срока кэша начинать обновление
+        self.refresh_ahead = timedelta(
+            seconds=int(os.getenv("PRICE_REFRESH_AHEAD", "120"))
+        )
+        # Не чаще одного повторного запроса за интервал после ошибки
+        self.retry_after = timedelta(seconds=self.interval)
+        self.status: Dict[str, dict] = {
+            key: {
+                "last_attempt": None,
+                "last_success": None,
+                "last_error": None,
+                "consecutive_failures": 0,
+            }
+            for key in parser.refresh_ttl
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+        self._pending: Set[str] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запускает периодическую проверку (из работающего цикла событий)"""
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает периодическую проверку и фоновые обновления"""
+        tasks = list(self._background)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def is_due(self, key: str) -> bool:
+        """Пора ли обновлять данные по ключу"""
+        age = self.parser.data_age(key)
+        return age is None or age >= self.parser.refresh_ttl[key] - self.refresh_ahead
+
+    def trigger(self, key: str):
+        """Запускает фоновое обновление, не дожидаясь его завершения"""
+        if key in self._pending or self.parser.refresh_in_flight(key):
+            return
+
+        last_attempt = self.status[key]["last_attempt"]
+        if (
+            self.status[key]["consecutive_failures"]
+            and last_attempt is not None
+            and datetime.now() - last_attempt < self.retry_after
+        ):
+            return
+
+        task = asyncio.get_running_loop().create_task(self.refresh(key))
+        self._pending.add(key)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(lambda _: self._pending.discard(key))
+
+    async def refresh(self, key: str) -> bool:
+        """Обновляет данные по ключу и записывает результат в статус"""
+        status = self.status[key]
+        status["last_attempt"] = datetime.now()
+        try:
+            result = await self.parser.refresh_async(key)
+            if result is None:
+                raise RuntimeError("API вернуло ошибку")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status["last_error"] = str(e)
+            status["consecutive_failures"] += 1
+            print(f"Ошибка обновления {key}: {e}")
+            return False
+
+        status["last_success"] = datetime.now()
+        status["last_error"] = None
+        status["consecutive_failures"] = 0
+        return True
+
+    async def _run(self):
+        while True:
+            for key in self.status:
+                if self.is_due(key) and not self.parser.refresh_in_flight(key):
+                    await self.refresh(key)
+            await asyncio.sleep(self.interval)
+
+    def get_status(self) -> dict:
+        """Состояние кэша и фонового обновления для админ-панели"""
+        keys = {}
+        for key, status in self.status.items():
+            age = self.parser.data_age(key)
+            ttl = self.parser.refresh_ttl[key]
+            keys[key] = {
+                **status,
+                "age_seconds": round(age.total_seconds()) if age else None,
+                "ttl_seconds": round(ttl.total_seconds()),
+                "stale": age is None or age > ttl,
+                "refreshing": key in self._pending
+                or self.parser.refresh_in_flight(key),
+            }
+
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "refresh_ahead_seconds": round(self.refresh_ahead.total_seconds()),
+            "max_staleness_seconds": round(self.parser.max_staleness.total_seconds()),
+            "keys": keys,
+        }
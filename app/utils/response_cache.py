@@ -0,0 +1,29 @@
+import hashlib
+
+import orjson
+from fastapi import Request, Response
+
+
+class CachedResponse:
+    """Готовое тело JSON-ответа вместе с его ETag"""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def render_model(model, data: dict, **dump_options) -> bytes:
+    """Проверяет данные через схему ответа и сериализует их в JSON (один раз)"""
+    return orjson.dumps(
+        model.model_validate(data).model_dump(mode="json", **dump_options)
+    )
+
+
+def cached_json_response(cached: CachedResponse, request: Request) -> Response:
+    """Отдает готовые байты ответа; 304, если у клиента актуальная версия"""
+    headers = {"ETag": cached.etag}
+    if request.headers.get("if-none-match") == cached.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
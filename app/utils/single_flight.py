@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один
+
+    Пока вызов по ключу выполняется, остальные вызывающие не запускают
+    свой, а дожидаются и получают его результат (или его исключение).
+    Рассчитан на корутины одного цикла событий.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет fn или дожидается уже идущего вызова с тем же ключом"""
+        loop = asyncio.get_running_loop()
+        future = self._futures.get(key)
+        if future is None or future.get_loop() is not loop:
+            future = loop.create_task(fn())
+            self._futures[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        # Отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(future)
+
+    def in_flight(self, key: str) -> bool:
+        """Выполняется ли сейчас вызов с этим ключом"""
+        future = self._futures.get(key)
+        return future is not None and not future.done()
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._futures.get(key) is future:
+            del self._futures[key]
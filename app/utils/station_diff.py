@@ -0,0 +1,75 @@
+from collections import deque
+from datetime import datetime
+from operator import attrgetter
+from typing import Dict, List, Optional
+
+from app.utils.station_records import Station, StationFuel
+
+_station_fields = attrgetter(*(name for name in Station.__slots__ if name != "fuel"))
+_fuel_fields = attrgetter(*StationFuel.__slots__)
+
+
+def station_fingerprint(azs: Station) -> tuple:
+    """Отпечаток данных АЗС, по которому определяется, изменилась ли станция
+
+    Включает все поля проекции Station: от координат и региона зависят
+    пространственный индекс, тайлы карты и поиск по региону. Порядок видов
+    топлива тоже учитывается - в нем они попадают в ответы.
+    """
+    return _station_fields(azs) + (tuple(map(_fuel_fields, azs.fuel)),)
+
+
+class StationDiff:
+    """Разница между двумя версиями списка АЗС (по ID станций)"""
+
+    def __init__(self, old_fingerprints: Dict, new_fingerprints: Dict):
+        self.added: List[int] = [
+            azs_id for azs_id in new_fingerprints if azs_id not in old_fingerprints
+        ]
+        self.removed: List[int] = [
+            azs_id for azs_id in old_fingerprints if azs_id not in new_fingerprints
+        ]
+        self.changed: List[int] = [
+            azs_id
+            for azs_id, fingerprint in new_fingerprints.items()
+            if azs_id in old_fingerprints and old_fingerprints[azs_id] != fingerprint
+        ]
+        self.unchanged = len(new_fingerprints) - len(self.added) - len(self.changed)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+
+class StationChangeLog:
+    """Журнал последних изменений списка АЗС при обновлениях"""
+
+    def __init__(self, max_entries: int = 100, max_ids: int = 50):
+        self.entries = deque(maxlen=max_entries)
+        self.max_ids = max_ids
+
+    def record(self, diff: Optional[StationDiff], total: int):
+        """Добавляет запись; diff=None - полная загрузка без предыдущей версии"""
+        entry = {"at": datetime.now(), "total": total, "full_load": diff is None}
+        if diff is not None:
+            entry.update(
+                {
+                    "unchanged": diff.unchanged,
+                    # Для больших изменений храним только первые max_ids ID
+                    "added": diff.added[: self.max_ids],
+                    "removed": diff.removed[: self.max_ids],
+                    "changed": diff.changed[: self.max_ids],
+                    "added_count": len(diff.added),
+                    "removed_count": len(diff.removed),
+                    "changed_count": len(diff.changed),
+                }
+            )
+        self.entries.append(entry)
+
+    def latest(self, limit: int = 20) -> List[dict]:
+        """Последние записи журнала, новые первыми"""
+        return list(reversed(self.entries))[:limit]
+
+
+# Глобальный журнал изменений списка АЗС
+station_changelog = StationChangeLog()
@@ -0,0 +1,101 @@
+from typing import Iterable, List, Optional, Tuple
+
+
+class StationFuel:
+    """Цена одного вида топлива на АЗС (только используемые поля ответа API)"""
+
+    __slots__ = ("fuel_type_id", "price", "discount_price", "currency_code", "updated")
+
+    def __init__(
+        self,
+        fuel_type_id: Optional[int],
+        price: Optional[float] = None,
+        discount_price: Optional[float] = None,
+        currency_code: str = "rub",
+        updated: Optional[float] = None,
+    ):
+        self.fuel_type_id = fuel_type_id
+        self.price = price
+        self.discount_price = discount_price
+        self.currency_code = currency_code
+        self.updated = updated
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StationFuel":
+        return cls(
+            data.get("fuel_type_id"),
+            data.get("price"),
+            data.get("discount_price"),
+            data.get("currency_code", "rub"),
+            data.get("updated"),
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Station:
+    """Компактная запись АЗС: только поля, которые использует приложение
+
+    Остальные поля ответа API отбрасываются сразу при разборе, поэтому в
+    памяти и в файловом кэше хранится только эта проекция.
+    """
+
+    __slots__ = (
+        "id",
+        "number",
+        "address",
+        "region",
+        "lat",
+        "lon",
+        "actualization_date",
+        "fuel",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int],
+        number: Optional[int],
+        address: Optional[str] = None,
+        region: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        actualization_date: Optional[float] = None,
+        fuel: Tuple[StationFuel, ...] = (),
+    ):
+        self.id = id
+        self.number = number
+        self.address = address
+        self.region = region
+        self.lat = lat
+        self.lon = lon
+        self.actualization_date = actualization_date
+        self.fuel = fuel
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Station":
+        return cls(
+            data.get("id"),
+            data.get("number"),
+            data.get("address"),
+            data.get("region"),
+            data.get("lat"),
+            data.get("lon"),
+            data.get("actualization_date"),
+            tuple(StationFuel.from_dict(fuel) for fuel in data.get("fuel") or ()),
+        )
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["fuel"] = [fuel.to_dict() for fuel in self.fuel]
+        return data
+
+
+def stations_from_dicts(items: Iterable[dict]) -> List[Station]:
+    """Проекция списка АЗС из ответа API или файлового кэша в компактные записи"""
+    return [Station.from_dict(item) for item in items]
+
+
+def stations_to_dicts(stations: Iterable[Station]) -> List[dict]:
+    """Записи АЗС в виде словарей для сохранения в файловый кэш"""
+    return [azs.to_dict() for azs in stations]
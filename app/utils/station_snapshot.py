@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import threading
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from app.utils.geo import SpatialIndex
+from app.utils.map_tiles import MapTiles
+from app.utils.station_diff import StationDiff, station_fingerprint
+from app.utils.station_records import Station
+
+_versions = itertools.count(1)
+
+
+def station_fingerprints(stations: Iterable[Station]) -> Dict[int, tuple]:
+    """Отпечатки станций по ID (при дублях - первой АЗС, как в by_id)"""
+    fingerprints = {}
+    for azs in stations:
+        if azs.id not in fingerprints:
+            fingerprints[azs.id] = station_fingerprint(azs)
+    return fingerprints
+
+
+def _region_keys(azs: Station) -> Iterable[Tuple[str, int]]:
+    if azs.region:
+        yield azs.region.casefold(), azs.id
+
+
+def _fuel_type_keys(azs: Station) -> Iterable[Tuple[int, int]]:
+    for fuel in azs.fuel:
+        yield fuel.fuel_type_id, azs.id
+
+
+def _patched_index(
+    index: Dict, removed: Iterable[tuple], added: Iterable[tuple]
+) -> Dict:
+    """Копия обратного индекса (ключ -> множество ID) с заменой части пар
+
+    Копируются только затронутые множества: предыдущий индекс остается
+    неизменным для запросов, которые еще читают старый снимок.
+    """
+    patched = dict(index)
+    copied = set()
+    for pairs, add in ((removed, False), (added, True)):
+        for key, azs_id in pairs:
+            if key not in copied:
+                patched[key] = set(patched.get(key, ()))
+                copied.add(key)
+            if add:
+                patched[key].add(azs_id)
+            else:
+                patched[key].discard(azs_id)
+    for key in copied:
+        if not patched[key]:
+            del patched[key]
+    return patched
+
+
+class StationSnapshot:
+    """Неизменяемый снимок списка АЗС вместе с построенными по нему индексами
+
+    Новый снимок полностью строится до того, как заменить старый, поэтому
+    запросы всегда видят согласованную пару «список + индексы». После
+    построения меняется только updated_at (если обновление не принесло
+    изменений и снимок переиспользуется). Тайлы карты - самый дорогой
+    индекс - строятся только при первом запросе тайла.
+
+    Если известны предыдущий снимок и разница с ним (previous и diff),
+    неизмененные АЗС берутся из предыдущего снимка, а индексы копируются
+    с заменой только измененных АЗС. changed_ids и previous_version
+    позволяют так же обновить и табло цен (см. PriceBoard).
+    """
+
+    def __init__(
+        self,
+        stations: List[Station],
+        updated_at: Optional[datetime] = None,
+        fingerprints: Optional[Dict[int, tuple]] = None,
+        previous: Optional["StationSnapshot"] = None,
+        diff: Optional[StationDiff] = None,
+    ):
+        self.version = next(_versions)
+        self.created_at = datetime.now()
+        # Время получения данных с сервера (для файлового кэша - время записи)
+        self.updated_at = updated_at or self.created_at
+        self._map_tiles: Optional[MapTiles] = None
+        self._map_tiles_lock = threading.Lock()
+
+        # АЗС, добавленные, измененные и удаленные относительно previous_version
+        self.previous_version: Optional[int] = None
+        self.changed_ids: Optional[FrozenSet[int]] = None
+        reused = None
+        if previous is not None and diff is not None:
+            self.previous_version = previous.version
+            self.changed_ids = frozenset(diff.added + diff.changed + diff.removed)
+            reused = self._reuse_unchanged(previous, stations)
+
+        self.stations = reused if reused is not None else stations
+        self.by_id: Dict[int, Station] = {}
+        self.by_number: Dict[int, List[Station]] = {}
+        for azs in self.stations:
+            # При дублях сохраняем первую АЗС, как и прежний линейный поиск
+            self.by_id.setdefault(azs.id, azs)
+            self.by_number.setdefault(azs.number, []).append(azs)
+
+        if reused is not None:
+            self._update_indexes(previous)
+        else:
+            self._build_indexes()
+
+        # Отпечатки станций для вычисления изменений при следующем обновлении
+        self.fingerprints = (
+            fingerprints if fingerprints is not None else station_fingerprints(stations)
+        )
+
+    def _reuse_unchanged(
+        self, previous: "StationSnapshot", stations: List[Station]
+    ) -> Optional[List[Station]]:
+        """Список АЗС, в котором неизмененные взяты из предыдущего снимка
+
+        Их данные совпадают по отпечатку, а индексы предыдущего снимка
+        ссылаются именно на эти записи. None - в списке есть повторы ID:
+        у повторов нет своих отпечатков, и индексы строятся заново.
+        """
+        if len(previous.by_id) != len(previous.stations):
+            return None
+        reused = []
+        seen = set()
+        for azs in stations:
+            if azs.id in seen:
+                return None
+            seen.add(azs.id)
+            if azs.id not in self.changed_ids:
+                azs = previous.by_id.get(azs.id, azs)
+            reused.append(azs)
+        return reused
+
+    def _build_indexes(self):
+        self.spatial_index = SpatialIndex(self.stations)
+        # Обратные индексы для поиска АЗС по региону и виду топлива
+        self.by_region: Dict[str, Set[int]] = {}
+        self.by_fuel_type: Dict[int, Set[int]] = {}
+        for azs in self.by_id.values():
+            for region, azs_id in _region_keys(azs):
+                self.by_region.setdefault(region, set()).add(azs_id)
+            for fuel_type_id, azs_id in _fuel_type_keys(azs):
+                self.by_fuel_type.setdefault(fuel_type_id, set()).add(azs_id)
+
+    def _update_indexes(self, previous: "StationSnapshot"):
+        """Индексы предыдущего снимка с заменой только измененных АЗС"""
+        old = [previous.by_id[i] for i in self.changed_ids if i in previous.by_id]
+        new = [self.by_id[i] for i in self.changed_ids if i in self.by_id]
+        self.spatial_index = previous.spatial_index.updated(old, new)
+        self.by_region = _patched_index(
+            previous.by_region,
+            (pair for azs in old for pair in _region_keys(azs)),
+            (pair for azs in new for pair in _region_keys(azs)),
+        )
+        self.by_fuel_type = _patched_index(
+            previous.by_fuel_type,
+            (pair for azs in old for pair in _fuel_type_keys(azs)),
+            (pair for azs in new for pair in _fuel_type_keys(azs)),
+        )
+
+    @property
+    def map_tiles(self) -> MapTiles:
+        """Тайлы карты; строятся при первом обращении (из async-кода - map_tiles_async)"""
+        if self._map_tiles is None:
+            with self._map_tiles_lock:
+                if self._map_tiles is None:
+                    self._map_tiles = MapTiles(self.stations)
+        return self._map_tiles
+
+    async def map_tiles_async(self) -> MapTiles:
+        """Тайлы карты; первое построение выполняется вне цикла событий"""
+        if self._map_tiles is not None:
+            return self._map_tiles
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.map_tiles)
+
+    def find(self, azs_number: int, azs_id: Optional[int] = None) -> Optional[Station]:
+        """Находит АЗС по номеру и ID; без ID возвращает первую АЗС с этим номером"""
+        if azs_id is not None:
+            azs = self.by_id.get(azs_id)
+            if azs is not None and azs.number == azs_number:
+                return azs
+            return None
+
+        stations = self.by_number.get(azs_number)
+        return stations[0] if stations else None
@@ -2,10 +2,6 @@ from typing import Optional
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from app import crud
-from app.utils.price_parser import PriceParser  
-
-
-price_parser = PriceParser()
 
 
 def validate_azs_number(azs_number: int):
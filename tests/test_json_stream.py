@@ -0,0 +1,70 @@
+import json
+import os
+import unittest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.utils.json_stream import JsonObjectStream
+from app.utils.price_parser import PriceParser
+
+
+def parse(body: dict, chunk_size: int):
+    raw = json.dumps(body, ensure_ascii=False).encode()
+    stream = JsonObjectStream("data")
+    items = []
+    for start in range(0, len(raw), chunk_size):
+        items += stream.feed(raw[start : start + chunk_size])
+    return items + stream.close()
+
+
+class JsonObjectStreamTest(unittest.TestCase):
+    def test_list_items_are_streamed_one_by_one(self):
+        body = {"status": "success", "data": [{"id": 1}, {"id": "ж"}], "n": 2}
+        for chunk_size in (1, 3, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    parse(body, chunk_size),
+                    [
+                        ("status", "success", False),
+                        ("data", {"id": 1}, True),
+                        ("data", {"id": "ж"}, True),
+                        ("n", 2, False),
+                    ],
+                )
+
+    def test_non_list_data_is_returned_whole(self):
+        self.assertEqual(
+            parse({"status": "error", "data": None}, 4),
+            [("status", "error", False), ("data", None, False)],
+        )
+        self.assertEqual(parse({"data": {"id": 1}}, 4), [("data", {"id": 1}, False)])
+
+    def test_truncated_body_raises_value_error(self):
+        stream = JsonObjectStream("data")
+        stream.feed(b'{"data": [1, 2')
+        with self.assertRaises(ValueError):
+            stream.close()
+
+
+class CollectAzsListTest(unittest.TestCase):
+    def collect(self, body: dict) -> dict:
+        data = {"data": []}
+        PriceParser._collect_azs_list(parse(body, 7), data)
+        return data
+
+    def test_api_error_keeps_data_as_is(self):
+        data = self.collect({"status": "error", "data": None})
+        self.assertEqual(data, {"status": "error", "data": None})
+        self.assertIsNone(PriceParser()._store_azs_list(data, None))
+
+    def test_only_list_objects_become_stations(self):
+        data = self.collect({"status": "success", "data": [{"id": 5}, 7, None]})
+        self.assertEqual([azs.id for azs in data["data"]], [5])
+
+        data = self.collect({"status": "success", "data": {"id": 5}})
+        self.assertEqual(data["data"], {"id": 5})
+        self.assertIsNone(PriceParser()._store_azs_list(data, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+
+# Пакет app.utils импортирует модули БД; для тестов достаточно SQLite в памяти
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.utils.price_board import PriceBoard
+from app.utils.price_parser import PriceParser
+from app.utils.station_records import Station, StationFuel
+from app.utils.station_snapshot import StationSnapshot
+
+FUEL_TYPES = {
+    1: {"name": "АИ-92", "color": "#f00", "filter_group": "Бензин"},
+    2: {"name": "ДТ", "color": "#00f", "filter_group": "Дизель"},
+}
+
+
+class Settings:
+    def __init__(self, discount_value=10):
+        self.discount_type = "percent"
+        self.discount_value = discount_value
+
+
+def make_station(azs_id: int, price: float = 50.0, **changes) -> Station:
+    fields = {
+        "id": azs_id,
+        "number": azs_id % 10,
+        "address": f"ул. Тестовая, {azs_id}",
+        "region": "Татарстан",
+        "lat": 55.0 + azs_id / 100,
+        "lon": 49.0 + azs_id / 100,
+        "actualization_date": 1700000000,
+        "fuel": (
+            StationFuel(1, price, None, "rub", 1700000000),
+            StationFuel(2, price + 10, None, "rub", 1700000000),
+        ),
+    }
+    fields.update(changes)
+    return Station(**fields)
+
+
+class IncrementalUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = PriceParser()
+        self.parser._set_fuel_types(FUEL_TYPES)
+        self.store([make_station(azs_id) for azs_id in range(1, 6)])
+        self.board = self.parser.get_price_board(Settings())
+        for azs_id in self.board.by_id:
+            self.board.get_response(("azs", azs_id), lambda: b"{}")
+
+    def store(self, stations):
+        self.parser._store_azs_list(
+            {"status": "success", "data": stations}, datetime.now()
+        )
+
+    def store_changes(self):
+        stations = [make_station(azs_id) for azs_id in (1, 2, 4, 5)]
+        stations[1] = make_station(2, price=45.0)
+        stations[2] = make_station(4, region="Чувашия", lat=56.5)
+        stations.append(make_station(6, price=40.0))
+        self.store(stations)
+
+    def test_only_changed_stations_are_rebuilt(self):
+        self.store_changes()
+        board = self.parser.get_price_board(Settings())
+
+        self.assertIs(board.by_id[1], self.board.by_id[1])
+        self.assertIs(board.responses[("azs", 1)], self.board.responses[("azs", 1)])
+        for azs_id in (2, 3, 4):
+            self.assertNotIn(("azs", azs_id), board.responses)
+        self.assertNotIn(3, board.by_id)
+        self.assertEqual(board.prices[2][1], 40.5)
+        self.assertIs(self.parser.snapshot.by_id[1], self.board.snapshot.by_id[1])
+
+    def test_incremental_update_matches_full_build(self):
+        self.store_changes()
+        snapshot = self.parser.snapshot
+        full_snapshot = StationSnapshot(list(snapshot.stations))
+        version = self.board.key[1]
+        full = PriceBoard(full_snapshot, FUEL_TYPES, version, Settings())
+
+        self.assertEqual(snapshot.by_region, full_snapshot.by_region)
+        self.assertEqual(snapshot.by_fuel_type, full_snapshot.by_fuel_type)
+        self.assertEqual(
+            [azs.id for _, azs in snapshot.spatial_index.nearest(56.5, 49.0, k=10)],
+            [
+                azs.id
+                for _, azs in full_snapshot.spatial_index.nearest(56.5, 49.0, k=10)
+            ],
+        )
+
+        # Вставка новых цен по одной и сортировка массива целиком
+        for insert_rows in (64, 0):
+            with self.subTest(insert_rows=insert_rows), mock.patch(
+                "app.utils.price_board.MERGE_INSERT_ROWS", insert_rows
+            ):
+                board = PriceBoard(
+                    snapshot, FUEL_TYPES, version, Settings(), previous=self.board
+                )
+                self.assertEqual(board.by_id, full.by_id)
+                self.assertEqual(board.prices, full.prices)
+                self.assertEqual(board.fuel_prices.keys(), full.fuel_prices.keys())
+                for fuel_type_id, (prices, ids) in full.fuel_prices.items():
+                    merged_prices, merged_ids = board.fuel_prices[fuel_type_id]
+                    np.testing.assert_array_equal(merged_prices, prices)
+                    np.testing.assert_array_equal(merged_ids, ids)
+
+    def test_settings_change_rebuilds_board(self):
+        self.store_changes()
+        board = self.parser.get_price_board(Settings(discount_value=5))
+
+        self.assertEqual(board.responses, {})
+        self.assertEqual(board.prices[1][1], 47.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import unittest
+from datetime import datetime
+
+# Пакет app.utils импортирует модули БД; для тестов достаточно SQLite в памяти
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.utils.price_parser import PriceParser
+from app.utils.station_diff import StationDiff, station_fingerprint
+from app.utils.station_records import Station, StationFuel
+
+
+def make_station(**changes) -> Station:
+    fields = {
+        "id": 1001,
+        "number": 2,
+        "address": "ул. Тестовая, 1",
+        "region": "Татарстан",
+        "lat": 55.0,
+        "lon": 49.0,
+        "actualization_date": 1700000000,
+        "fuel": (StationFuel(1, 50.5, 49.0, "rub", 1700000000),),
+    }
+    fields.update(changes)
+    return Station(**fields)
+
+
+class StationFingerprintTest(unittest.TestCase):
+    def test_every_projected_field_changes_fingerprint(self):
+        base = station_fingerprint(make_station())
+        changes = {
+            "number": 3,
+            "address": "ул. Новая, 2",
+            "region": "Чувашия",
+            "lat": 56.0,
+            "lon": 50.0,
+            "actualization_date": 1700000001,
+            "fuel": (StationFuel(1, 51.0, 49.0, "rub", 1700000000),),
+        }
+        for name, value in changes.items():
+            with self.subTest(field=name):
+                changed = station_fingerprint(make_station(**{name: value}))
+                self.assertNotEqual(base, changed)
+
+    def test_moved_station_is_reported_as_changed(self):
+        old = {1001: station_fingerprint(make_station())}
+        new = {1001: station_fingerprint(make_station(lat=56.0, region="Чувашия"))}
+        diff = StationDiff(old, new)
+        self.assertEqual(diff.changed, [1001])
+        self.assertFalse(diff.is_empty)
+
+
+class StoreAzsListTest(unittest.TestCase):
+    def test_moved_station_replaces_snapshot(self):
+        parser = PriceParser()
+        parser._store_azs_list(
+            {"status": "success", "data": [make_station()]}, datetime.now()
+        )
+        moved = make_station(lat=56.0, region="Чувашия")
+        parser._store_azs_list({"status": "success", "data": [moved]}, datetime.now())
+
+        azs = parser.snapshot.by_id[1001]
+        self.assertEqual((azs.lat, azs.region), (56.0, "Чувашия"))
+        self.assertIn("чувашия", parser.snapshot.by_region)
+        self.assertNotIn("татарстан", parser.snapshot.by_region)
+
+    def test_unchanged_list_keeps_snapshot_without_building_tiles(self):
+        parser = PriceParser()
+        parser._store_azs_list(
+            {"status": "success", "data": [make_station()]}, datetime.now()
+        )
+        snapshot = parser.snapshot
+        parser._store_azs_list(
+            {"status": "success", "data": [make_station()]}, datetime.now()
+        )
+
+        self.assertIs(parser.snapshot, snapshot)
+        self.assertIsNone(snapshot._map_tiles)
+        self.assertEqual(snapshot.map_tiles.size, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()